@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Sequence
+
+from app.database import db, reset_db_state, run_db
+
+logger = logging.getLogger(__name__)
+
+class WriteBatcher:
+    """Group-commits writes submitted by concurrent requests.
+
+    Items submitted within ``window_seconds`` of the first pending one, or
+    until ``max_batch_size`` items are pending, are written together by a
+    single call to ``flush``. ``flush`` runs in the database executor, takes
+    the list of items and returns one result per item in the same order;
+    each submitter is resumed with its own result, or with the exception if
+    the whole batch failed.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int,
+        window_seconds: float
+    ):
+        self._flush_func = flush
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self._pending = []
+        self._timer = None
+        # The event loop only keeps weak references to tasks; flushes in
+        # flight are held here so they cannot be collected before they resolve
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+        self.max_batch = 0
+        self.total_flush = 0.0
+        self.max_flush = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush_pending)
+        return await future
+
+    def _flush_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Write the pending items and wait for every flush in flight."""
+        self._flush_pending()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _flush(self, batch):
+        # The batch is written on its own pooled connection, not on the
+        # connection of whichever request happened to trigger the flush
+        reset_db_state()
+        start = time.monotonic()
+        try:
+            results = await run_db(self._flush_func, [item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Batched write of {len(batch)} items failed: {e}")
+            with self._lock:
+                self.failures += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            if not db.is_closed():
+                db.close()
+
+        self._record(len(batch), time.monotonic() - start)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size, elapsed):
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.max_batch = max(self.max_batch, size)
+            self.total_flush += elapsed
+            self.max_flush = max(self.max_flush, elapsed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window_seconds * 1000,
+                "pending": len(self._pending),
+                "batches": self.batches,
+                "items": self.items,
+                "failures": self.failures,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "max_batch": self.max_batch,
+                "avg_flush_ms": (self.total_flush / self.batches * 1000) if self.batches else 0.0,
+                "max_flush_ms": self.max_flush * 1000,
+            }
@@ -0,0 +1,190 @@
+"""Brotli and gzip compression of HTTP responses.
+
+JSON feeds and chat histories compress several times over, so responses
+of at least ``minimum_size`` bytes are compressed with the best encoding
+the client accepts: brotli when the optional ``brotli`` package is
+installed, gzip otherwise. Small bodies, responses that are already
+encoded and content types that do not compress well pass through as they
+are. WebSocket traffic is never touched.
+"""
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # Brotli support is optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        # wbits=31 writes the gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Content codings in an Accept-Encoding header with their q-values."""
+    encodings = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for a client, or None to send the body as is."""
+    encodings = accepted_encodings(accept_encoding)
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    candidates = [name for name in supported if encodings.get(name, encodings.get("*", 0)) > 0]
+    if not candidates:
+        return None
+    # Ties go to brotli, which compresses JSON noticeably better
+    return max(candidates, key=lambda name: encodings.get(name, encodings.get("*", 0)))
+
+class CompressionStats:
+    """Counters of how much the compressed responses shrank."""
+
+    def __init__(self):
+        self.responses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int):
+        self.responses[encoding] = self.responses.get(encoding, 0) + 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def as_dict(self) -> dict:
+        return {
+            "responses": dict(self.responses),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.bytes_out / self.bytes_in if self.bytes_in else 0.0,
+        }
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        stats: Optional[CompressionStats] = None
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.stats = stats
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("Accept-Encoding", ""))
+            if encoding is not None:
+                if encoding == "br":
+                    encoder = BrotliEncoder(self.brotli_quality)
+                else:
+                    encoder = GzipEncoder(self.gzip_level)
+                responder = CompressionResponder(self.app, encoder, self.minimum_size, self.stats)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+class CompressionResponder:
+    """Compresses one response, buffering only its start message."""
+
+    def __init__(self, app: ASGIApp, encoder, minimum_size: int, stats: Optional[CompressionStats]):
+        self.app = app
+        self.encoder = encoder
+        self.minimum_size = minimum_size
+        self.stats = stats
+        self.send = None
+        self.initial_message = None
+        self.passthrough = False
+        self.started = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self.initial_message = message
+            self.passthrough = not self.compressible(Headers(raw=message["headers"]))
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            if not self.started and self.initial_message is not None:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            if len(body) < self.minimum_size and not more_body:
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+            headers["Content-Encoding"] = self.encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            compressed = self.compress(body, more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+            await self.send(self.initial_message)
+        else:
+            compressed = self.compress(body, more_body)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self.encoder.compress(body)
+        if not more_body:
+            data += self.encoder.finish()
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        if not more_body and self.stats is not None:
+            self.stats.record(self.encoder.name, self.bytes_in, self.bytes_out)
+        return data
@@ -0,0 +1,27 @@
+import hashlib
+from typing import Any, Optional
+
+# Conditional GET: a polled endpoint tags its response with a version derived
+# from a cheap query, and a client that already holds that version gets an
+# empty 304 Not Modified instead of the full payload.
+
+def make_etag(*parts: Any) -> str:
+    """A weak entity tag for the response described by ``parts``.
+
+    Weak because the body is the same whichever content coding it is sent
+    with.
+    """
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
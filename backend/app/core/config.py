@@ -12,6 +12,12 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-here"  # Change in production
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    PASSWORD_HASH_WORKERS: int = 2  # Processes running bcrypt
+    PASSWORD_HASH_QUEUE_SIZE: int = 64  # Pending hashes before returning 503
+
+    # Authenticated user cache
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL_SECONDS: int = 60
     
     # Database
     DATABASE_URL: str = "postgresql://postgres:postgres@db:5432/enbysocial"
@@ -20,6 +26,14 @@ class Settings(BaseSettings):
     DB_USER: str = "postgres"
     DB_PASSWORD: str = "postgres"
     DB_NAME: str = "enbysocial"
+
+    # Database connection pool
+    DB_POOL_MAX_CONNECTIONS: int = 20
+    DB_POOL_TIMEOUT: int = 10  # Seconds to wait for a free connection
+    DB_POOL_STALE_TIMEOUT: int = 1800  # Recycle connections older than 30 minutes
+    DB_POOL_IDLE_TIMEOUT: int = 300  # Close connections idle in the pool for 5 minutes
+    DB_POOL_CHECK_INTERVAL: int = 30  # Ping connections idle longer than this before reuse
+    DB_EXECUTOR_WORKERS: int = 20  # Threads running blocking queries
     
     # CORS
     BACKEND_CORS_ORIGINS: list = [
@@ -37,9 +51,32 @@ class Settings(BaseSettings):
     # Geolocation
     DEFAULT_RADIUS_MILES: float = 50.0
     MAX_RADIUS_MILES: float = 100.0
+
+    # In-memory spatial index of active ads
+    SPATIAL_INDEX_ENABLED: bool = False
+    SPATIAL_INDEX_CELL_DEGREES: float = 0.25
+    SPATIAL_INDEX_MEMORY_MB: int = 256
+    SPATIAL_INDEX_REBUILD_SECONDS: int = 300
+    
+    # Response compression (brotli when installed, else gzip)
+    COMPRESSION_MIN_SIZE: int = 1024  # Smaller bodies are sent as they are
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    
+    # Message inserts are group-committed in batches
+    MESSAGE_BATCH_MAX_SIZE: int = 100
+    MESSAGE_BATCH_WINDOW_MS: int = 5
     
     # WebSocket
     WS_MESSAGE_QUEUE_SIZE: int = 100
+    WS_COALESCE_MAX_EVENTS: int = 50  # Queued events sent together in one frame
+    WS_MAX_CONNECTIONS: int = 10_000  # Sockets accepted per worker
+    WS_HEARTBEAT_SECONDS: int = 30  # Ping sockets quiet for this long
+    WS_IDLE_TIMEOUT_SECONDS: int = 90  # Evict sockets silent for this long
+    WS_HANDSHAKE_CONCURRENCY: int = 100  # Sockets authenticated at once
+    WS_HANDSHAKE_TIMEOUT_SECONDS: int = 10  # Wait for a handshake slot before rejecting
+    WS_PUBSUB_ENABLED: bool = False  # Fan events out to other workers via LISTEN/NOTIFY
+    WS_PUBSUB_RECONNECT_SECONDS: int = 5
     
     class Config:
         case_sensitive = True
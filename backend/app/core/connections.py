@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from app.core.events import CODECS, JSON, PING, Codec, Event
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to clients that cannot keep up with their messages
+# ("try again later"); they reconnect and catch up through the REST API.
+# Also used to turn sockets away when the worker is at capacity.
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Close code sent to clients that stopped answering heartbeats ("going away")
+IDLE_CLOSE_CODE = 1001
+
+class ClientConnection:
+    """One WebSocket with a bounded outbound queue drained by a writer task.
+
+    When several events are queued by the time the writer gets to them, up
+    to ``max_coalesce`` of them go out together in a single frame. Slots
+    keep the per-socket footprint small enough for very many connections.
+    """
+
+    __slots__ = (
+        "websocket", "user_id", "queue", "codec", "max_coalesce", "writer",
+        "frames_sent", "events_sent", "last_seen",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        queue_size: int,
+        codec: Codec = JSON,
+        max_coalesce: int = 1
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.codec = codec
+        self.max_coalesce = max_coalesce
+        self.writer = None
+        self.frames_sent = 0
+        self.events_sent = 0
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        """Record that the client has just sent something."""
+        self.last_seen = time.monotonic()
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write())
+
+    def offer(self, event: Event) -> bool:
+        """Queue an event without waiting; False if the queue is full."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _write(self):
+        try:
+            while True:
+                events = [await self.queue.get()]
+                while len(events) < self.max_coalesce and not self.queue.empty():
+                    events.append(self.queue.get_nowait())
+                frame = self.codec.frame(events)
+                if self.codec.binary:
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+                self.frames_sent += 1
+                self.events_sent += len(events)
+        except Exception as e:
+            # The receive loop notices the broken socket and disconnects it
+            logger.info(f"WebSocket writer for user {self.user_id} stopped: {e}")
+
+    async def close(self, code: int = 1000):
+        if self.writer is not None:
+            self.writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            # Already closed by the client or the server
+            pass
+
+class ConnectionManager:
+    """WebSocket connections of every user connected to this worker.
+
+    A user may be connected from several devices at once. Events are
+    queued per connection and written by that connection's own task, so
+    delivering an event never waits on a client. A connection whose queue
+    is full is disconnected rather than allowed to hold events back.
+
+    A single heartbeat task pings sockets that have been quiet for a while
+    and evicts those that stay silent past ``idle_timeout``, so half-open
+    connections do not pile up. At most ``max_connections`` sockets are
+    accepted per worker, and at most ``handshake_concurrency`` of them are
+    authenticated at once so a reconnect storm queues here instead of on
+    the database.
+    """
+
+    def __init__(
+        self,
+        queue_size: int,
+        max_coalesce: int = 1,
+        max_connections: Optional[int] = None,
+        heartbeat_interval: float = 30,
+        idle_timeout: float = 90,
+        handshake_concurrency: int = 100,
+        handshake_timeout: float = 10
+    ):
+        self.queue_size = queue_size
+        self.max_coalesce = max_coalesce
+        self.max_connections = max_connections
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.handshake_timeout = handshake_timeout
+        self._handshakes = asyncio.Semaphore(handshake_concurrency)
+        self.handshakes_waiting = 0
+        self.handshake_timeouts = 0
+        self.active_connections: Dict[int, Set[ClientConnection]] = {}
+        self.connection_count = 0
+        # Slots claimed by sockets still being authenticated
+        self.reserved = 0
+        self.peak_connections = 0
+        self.rejected = 0
+        self.idle_evictions = 0
+        self.events_queued = 0
+        self.slow_disconnects = 0
+        # Totals of connections that have since closed
+        self._frames_sent = 0
+        self._events_sent = 0
+
+    def at_capacity(self) -> bool:
+        return (
+            self.max_connections is not None and
+            self.connection_count + self.reserved >= self.max_connections
+        )
+
+    def reserve(self) -> bool:
+        """Claim a slot for a socket about to be set up; False if the worker is full.
+
+        Checked and claimed in one step, so concurrent handshakes cannot
+        overshoot ``max_connections``. The slot passes to the connection on
+        ``connect(..., reserved=True)`` or is given back with ``release()``.
+        """
+        if self.at_capacity():
+            return False
+        self.reserved += 1
+        return True
+
+    def release(self):
+        """Give back a slot reserved for a socket that never connected."""
+        self.reserved -= 1
+
+    @asynccontextmanager
+    async def admission(self):
+        """Hold one of the handshake slots; yields False if none freed up in time."""
+        self.handshakes_waiting += 1
+        try:
+            await asyncio.wait_for(self._handshakes.acquire(), self.handshake_timeout)
+            admitted = True
+        except asyncio.TimeoutError:
+            self.handshake_timeouts += 1
+            admitted = False
+        finally:
+            self.handshakes_waiting -= 1
+        if not admitted:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self._handshakes.release()
+
+    async def reject(self, websocket: WebSocket):
+        """Turn a socket away because the worker is at capacity."""
+        self.rejected += 1
+        # Closing before accepting fails the handshake with HTTP 403; the
+        # close code only reaches clients over an accepted socket
+        await websocket.accept()
+        await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        subprotocol: Optional[str] = None,
+        reserved: bool = False
+    ) -> ClientConnection:
+        """Accept a socket, speaking the negotiated subprotocol if any.
+
+        ``reserved`` says the socket holds a slot from ``reserve()``.
+        """
+        await websocket.accept(subprotocol=subprotocol)
+        connection = ClientConnection(
+            websocket,
+            user_id,
+            self.queue_size,
+            codec=CODECS[subprotocol] if subprotocol else JSON,
+            max_coalesce=self.max_coalesce
+        )
+        connection.start()
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        if reserved:
+            self.reserved -= 1
+        self.connection_count += 1
+        self.peak_connections = max(self.peak_connections, self.connection_count)
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        connections = self.active_connections.get(connection.user_id)
+        if connections is not None and connection in connections:
+            connections.discard(connection)
+            if not connections:
+                del self.active_connections[connection.user_id]
+            self.connection_count -= 1
+            self._frames_sent += connection.frames_sent
+            self._events_sent += connection.events_sent
+        if connection.writer is not None:
+            connection.writer.cancel()
+
+    def send(self, connection: ClientConnection, event: Event):
+        """Queue an event for one connection, dropping it if it is full."""
+        if connection.offer(event):
+            self.events_queued += 1
+        else:
+            logger.warning(f"Disconnecting slow WebSocket client of user {connection.user_id}")
+            self.slow_disconnects += 1
+            self.disconnect(connection)
+            asyncio.create_task(connection.close(SLOW_CONSUMER_CLOSE_CODE))
+
+    def send_personal_message(self, event: Event, user_id: int):
+        """Queue an event for every connection of a user."""
+        for connection in list(self.active_connections.get(user_id, ())):
+            self.send(connection, event)
+
+    def sweep(self):
+        """Ping quiet sockets and evict the ones that stopped answering."""
+        now = time.monotonic()
+        ping = Event(PING, {})
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                idle = now - connection.last_seen
+                if idle > self.idle_timeout:
+                    self.idle_evictions += 1
+                    self.disconnect(connection)
+                    asyncio.create_task(connection.close(IDLE_CLOSE_CODE))
+                elif idle > self.heartbeat_interval:
+                    self.send(connection, ping)
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            self.sweep()
+
+    def stats(self) -> dict:
+        connections = [c for user in self.active_connections.values() for c in user]
+        return {
+            "users": len(self.active_connections),
+            "connections": len(connections),
+            "max_connections": self.max_connections,
+            "reserved": self.reserved,
+            "peak_connections": self.peak_connections,
+            "rejected": self.rejected,
+            "idle_evictions": self.idle_evictions,
+            "handshakes_waiting": self.handshakes_waiting,
+            "handshake_timeouts": self.handshake_timeouts,
+            "queued_messages": sum(c.queue.qsize() for c in connections),
+            "queue_size": self.queue_size,
+            "events_queued": self.events_queued,
+            "frames_sent": self._frames_sent + sum(c.frames_sent for c in connections),
+            "events_sent": self._events_sent + sum(c.events_sent for c in connections),
+            "slow_disconnects": self.slow_disconnects,
+        }
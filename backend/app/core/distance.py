@@ -0,0 +1,46 @@
+"""Vectorised great-circle distances for batches of coordinates.
+
+Distances use the haversine formula on a sphere with the mean Earth radius.
+Compared with geopy's ``geodesic`` (WGS-84 ellipsoid) the error is at most
+about 0.5% and typically below 0.3%, so only points within that margin of a
+search radius can land on the other side of the cut.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+from app.core.geo import EARTH_RADIUS_MILES
+
+def haversine_miles(
+    latitude: float,
+    longitude: float,
+    latitudes: Sequence[float],
+    longitudes: Sequence[float]
+) -> np.ndarray:
+    """Return the distance in miles from one point to each point of a batch."""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def nearest_within(
+    distances: np.ndarray,
+    radius_miles: Optional[float] = None,
+    ids: Optional[Sequence[int]] = None
+) -> np.ndarray:
+    """Indices of the distances inside a radius, nearest first.
+
+    Without a radius every index is returned, still ordered by distance.
+    Passing ``ids`` breaks ties between equal distances by id, giving the
+    stable ``(distance, id)`` order that keyset pagination relies on.
+    """
+    if radius_miles is None:
+        indices = np.arange(len(distances))
+    else:
+        indices = np.flatnonzero(distances <= radius_miles)
+    if ids is None:
+        return indices[np.argsort(distances[indices], kind="stable")]
+    return indices[np.lexsort((np.asarray(ids)[indices], distances[indices]))]
@@ -0,0 +1,111 @@
+"""Wire format of the real-time events pushed over WebSockets.
+
+Every event is an envelope ``{"type": ..., "data": {...}}``. Clients speak
+JSON by default, or MessagePack when they request the ``msgpack``
+subprotocol at connect time. An event is encoded at most once per format
+however many sockets it goes to, and several events queued for the same
+socket are sent as one frame holding an array of envelopes.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # MessagePack support is optional
+    msgpack = None
+
+# Event types
+NEW_MESSAGE = "new_message"
+MESSAGES_READ = "messages_read"
+ACK = "ack"
+ERROR = "error"
+PING = "ping"
+
+# Frames sent by clients
+SEND_MESSAGE = "send_message"
+PONG = "pong"
+
+class Event:
+    """A typed event envelope with its encodings cached per codec."""
+
+    __slots__ = ("type", "data", "_encoded")
+
+    def __init__(self, type: str, data: Dict[str, Any]):
+        self.type = type
+        self.data = data
+        self._encoded = {}
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        return {"type": self.type, "data": self.data}
+
+    def encode(self, codec: "Codec") -> bytes:
+        encoded = self._encoded.get(codec.name)
+        if encoded is None:
+            encoded = self._encoded[codec.name] = codec.dumps(self.payload)
+        return encoded
+
+class Codec(ABC):
+    """Encodes events for one wire format and decodes client frames."""
+
+    name = None
+    binary = False
+
+    @abstractmethod
+    def dumps(self, payload: Dict[str, Any]) -> bytes:
+        """Encode one event envelope."""
+
+    @abstractmethod
+    def loads(self, frame):
+        """Decode a frame received from a client."""
+
+    @abstractmethod
+    def array(self, encoded: List[bytes]) -> bytes:
+        """Join already encoded events into one array frame."""
+
+    def frame(self, events: List[Event]):
+        """The frame carrying one or more events, ready for the socket."""
+        if len(events) == 1:
+            data = events[0].encode(self)
+        else:
+            data = self.array([event.encode(self) for event in events])
+        return data if self.binary else data.decode()
+
+class JSONCodec(Codec):
+    name = "json"
+
+    def dumps(self, payload):
+        return orjson.dumps(payload)
+
+    def loads(self, frame):
+        return orjson.loads(frame)
+
+    def array(self, encoded):
+        return b"[" + b",".join(encoded) + b"]"
+
+class MessagePackCodec(Codec):
+    name = "msgpack"
+    binary = True
+
+    def dumps(self, payload):
+        return msgpack.packb(payload)
+
+    def loads(self, frame):
+        return msgpack.unpackb(frame)
+
+    def array(self, encoded):
+        return msgpack.Packer().pack_array_header(len(encoded)) + b"".join(encoded)
+
+JSON = JSONCodec()
+CODECS = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MessagePackCodec.name] = MessagePackCodec()
+
+def negotiate(subprotocols: List[str]) -> Optional[str]:
+    """The first subprotocol offered by the client that is supported."""
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return subprotocol
+    return None
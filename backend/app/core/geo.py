@@ -0,0 +1,142 @@
+from math import asin, cos, degrees, pi, radians, sin
+from typing import List, Optional, Tuple
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 2 * pi * EARTH_RADIUS_MILES / 360
+
+# Geohashes are stored at ~5 m resolution; queries use shorter prefixes.
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# geodesic() measures on the WGS-84 ellipsoid, which differs from the sphere
+# used here by up to ~0.5%. Widening the box by this factor keeps it a strict
+# superset of the exact search radius.
+BOUNDING_BOX_MARGIN = 1.01
+
+def bounding_box(
+    latitude: float,
+    longitude: float,
+    radius_miles: float
+) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """Return the latitude range and longitude ranges enclosing a radius.
+
+    The longitude span is returned as a list of ranges because a box that
+    crosses the antimeridian has to be split in two. Near the poles every
+    longitude is in range.
+    """
+    angular_radius = radius_miles * BOUNDING_BOX_MARGIN / EARTH_RADIUS_MILES
+    lat_delta = degrees(angular_radius)
+    min_lat = latitude - lat_delta
+    max_lat = latitude + lat_delta
+
+    if min_lat <= -90 or max_lat >= 90 or angular_radius >= radians(90):
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    lon_delta = degrees(asin(min(1.0, sin(angular_radius) / cos(radians(latitude)))))
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a coordinate as a base32 geohash of the given length."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        # Even bits refine longitude, odd bits refine latitude
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def decode_geohash(geohash: str) -> Tuple[float, float, float, float]:
+    """Return the centre latitude, longitude and half-sizes of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return (
+        (lat_range[0] + lat_range[1]) / 2,
+        (lon_range[0] + lon_range[1]) / 2,
+        (lat_range[1] - lat_range[0]) / 2,
+        (lon_range[1] - lon_range[0]) / 2,
+    )
+
+def geohash_neighbors(geohash: str) -> List[str]:
+    """Return a geohash cell and its (up to) eight neighbours."""
+    latitude, longitude, lat_err, lon_err = decode_geohash(geohash)
+    cells = []
+    for lat_step in (-1, 0, 1):
+        lat = latitude + lat_step * 2 * lat_err
+        if not -90 < lat < 90:
+            continue
+        for lon_step in (-1, 0, 1):
+            lon = (longitude + lon_step * 2 * lon_err + 180) % 360 - 180
+            cell = encode_geohash(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+def location_geohash(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    """Geohash stored alongside a row's coordinates, if it has any."""
+    if latitude is None or longitude is None:
+        return None
+    return encode_geohash(latitude, longitude)
+
+def geohash_cells(latitude: float, longitude: float, radius_miles: float) -> List[str]:
+    """Return geohash prefixes whose cells together cover a search radius.
+
+    The prefix length is the longest one whose cells are at least as large
+    as the radius, so the cell containing the point plus its neighbours
+    enclose the whole circle. An empty list means the radius is too large
+    (or too close to a pole) for a prefix lookup to narrow anything down.
+    """
+    lat_delta = degrees(radius_miles * BOUNDING_BOX_MARGIN / EARTH_RADIUS_MILES)
+    widest_lat = abs(latitude) + lat_delta
+    if widest_lat >= 90:
+        return []
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lon_bits = (5 * precision + 1) // 2
+        lat_bits = 5 * precision // 2
+        cell_height = 180 / 2 ** lat_bits * MILES_PER_DEGREE
+        cell_width = 360 / 2 ** lon_bits * MILES_PER_DEGREE * cos(radians(widest_lat))
+        if min(cell_height, cell_width) >= radius_miles * BOUNDING_BOX_MARGIN:
+            return geohash_neighbors(encode_geohash(latitude, longitude, precision))
+    return []
+
+def geohash_prefix_range(prefix: str) -> Tuple[str, str]:
+    """Inclusive range of stored geohashes that start with ``prefix``.
+
+    A plain range comparison is used instead of LIKE so an ordinary btree
+    index serves the lookup regardless of the column's collation.
+    """
+    return prefix, prefix + GEOHASH_ALPHABET[-1] * (GEOHASH_PRECISION - len(prefix))
@@ -0,0 +1,60 @@
+import base64
+import json
+from bisect import bisect_right
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+
+# Keyset pagination: a cursor holds the sort key of the last row of a page and
+# the next page starts strictly after it, so the cost of a page never depends
+# on how deep into the result set it is.
+
+# Response header carrying the cursor of the next page, so list endpoints keep
+# returning a plain JSON array.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types: type) -> Tuple:
+    """Decode a cursor produced by ``encode_cursor``.
+
+    ``types`` gives the expected type of each value; a cursor that does not
+    match is rejected with 400 rather than reaching the query.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        decoded = []
+        for value, expected in zip(values, types):
+            if expected is float and isinstance(value, int):
+                value = float(value)
+            if isinstance(value, bool) or not isinstance(value, expected):
+                raise ValueError
+            decoded.append(value)
+        return tuple(decoded)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_page(
+    items: Sequence,
+    key: Callable[[Any], Tuple],
+    after: Optional[Tuple],
+    limit: int
+) -> Tuple[List, Optional[Tuple]]:
+    """Slice a list already ordered by ``key`` to the page following ``after``.
+
+    Returns the page and the key to continue from, or None on the last page.
+    """
+    start = bisect_right(items, after, key=key) if after is not None else 0
+    page = list(items[start:start + limit])
+    if page and start + limit < len(items):
+        return page, key(page[-1])
+    return page, None
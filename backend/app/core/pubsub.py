@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Callable
+
+import orjson
+
+from app.core.connections import ConnectionManager
+from app.core.events import Event
+from app.database import db, run_db
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "ws_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7999
+
+class EventBridge:
+    """Fans WebSocket events out to every worker through Postgres NOTIFY.
+
+    An event is delivered to the sockets connected to this worker straight
+    away and published on a channel every worker LISTENs on. Each worker
+    delivers the events published by the others to its own sockets, so a
+    user is reached whichever worker their socket is connected to.
+
+    Events that do not fit in a NOTIFY payload are delivered locally only;
+    clients elsewhere pick the message up through the REST API.
+    """
+
+    def __init__(self, manager: ConnectionManager, channel: str = NOTIFY_CHANNEL):
+        self.manager = manager
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self.enabled = False
+        self._connect = None
+        self._conn = None
+        self._loop = None
+        self._reconnect_task = None
+        self._reconnect_seconds = 5
+        self.published = 0
+        self.received = 0
+        self.oversized = 0
+        self.errors = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    async def start(self, connect: Callable, reconnect_seconds: int = 5):
+        """Begin listening; ``connect`` opens a dedicated psycopg2 connection."""
+        self._connect = connect
+        self._reconnect_seconds = reconnect_seconds
+        self._loop = asyncio.get_running_loop()
+        self.enabled = True
+        await self._listen()
+
+    async def stop(self):
+        self.enabled = False
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self._close_listener()
+
+    async def send(self, user_id: int, event: Event):
+        """Deliver an event to a user's sockets on every worker."""
+        self.manager.send_personal_message(event, user_id)
+        if not self.enabled:
+            return
+        payload = self.encode(user_id, event)
+        if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            self.oversized += 1
+            return
+        try:
+            await run_db(self.publish, payload)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to publish WebSocket event: {e}")
+
+    def publish(self, payload: str):
+        # Called from socket handlers, which no request middleware closes
+        # up after, so the connection is held for the NOTIFY alone
+        with db.connection_context():
+            db.execute_sql('SELECT pg_notify(%s, %s)', (self.channel, payload))
+
+    def encode(self, user_id: int, event: Event) -> str:
+        return orjson.dumps({
+            "origin": self.worker_id,
+            "user_id": user_id,
+            "sent_at": time.time(),
+            "event": event.payload,
+        }).decode()
+
+    def dispatch(self, payload: str):
+        """Deliver an event received from the channel to local sockets."""
+        try:
+            event = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            self.errors += 1
+            logger.warning("Ignoring malformed WebSocket event")
+            return
+        if event["origin"] == self.worker_id:
+            # Already delivered locally when it was published
+            return
+        # Measured against the publishing worker's clock
+        lag = max(0.0, time.time() - event["sent_at"])
+        self.received += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.manager.send_personal_message(
+            Event(event["event"]["type"], event["event"]["data"]),
+            event["user_id"]
+        )
+
+    async def _listen(self):
+        conn = await self._loop.run_in_executor(None, self._connect)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        self._conn = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        logger.info(f"Listening for WebSocket events on {self.channel}")
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"WebSocket event listener lost its connection: {e}")
+            self._close_listener()
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+            return
+        while self._conn.notifies:
+            self.dispatch(self._conn.notifies.pop(0).payload)
+
+    async def _reconnect(self):
+        # Events published while disconnected are not replayed; clients
+        # catch up through the REST API
+        while self.enabled:
+            await asyncio.sleep(self._reconnect_seconds)
+            try:
+                await self._listen()
+                return
+            except Exception as e:
+                logger.error(f"WebSocket event listener reconnect failed: {e}")
+
+    def _close_listener(self):
+        if self._conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._conn.fileno())
+        except Exception:
+            pass
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "listening": self._conn is not None,
+            "published": self.published,
+            "received": self.received,
+            "oversized": self.oversized,
+            "errors": self.errors,
+            "avg_lag_ms": (self.total_lag / self.received * 1000) if self.received else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+        }
@@ -0,0 +1,76 @@
+"""Fast path for list endpoints.
+
+Rows are fetched as plain dicts holding exactly the columns of the response
+schema and written out by orjson, skipping model hydration and per-row
+pydantic validation. The endpoints keep their ``response_model`` for the
+OpenAPI schema; returning a response directly bypasses re-validation.
+
+Read endpoints also accept a ``fields=`` query parameter naming the subset
+of the schema a client needs, which narrows both the columns selected and
+the payload sent.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query, status
+from peewee import ForeignKeyField, Model
+from pydantic import BaseModel
+
+def schema_columns(model: Type[Model], schema: Type[BaseModel]) -> Dict:
+    """Columns producing rows keyed like ``schema``, by schema field name.
+
+    ``model`` may also be an alias of a model. A ``<name>_id`` schema field
+    maps to the ``<name>`` foreign key. Schema fields with no column behind
+    them (computed values) are left out and are up to the caller to fill in.
+    """
+    fields = model._meta.fields
+    columns = {}
+    for name in schema.model_fields:
+        field = fields.get(name)
+        if field is None and name.endswith("_id"):
+            field = fields.get(name[:-3])
+            if not isinstance(field, ForeignKeyField):
+                field = None
+        if field is not None:
+            # Resolved through the model so an alias's columns stay qualified by it
+            column = getattr(model, field.name)
+            columns[name] = column.alias(name) if field.name != name else column
+    return columns
+
+def pick_columns(columns: Dict, fields: Iterable[str]) -> List:
+    """The columns behind ``fields``, in column order."""
+    fields = set(fields)
+    return [column for name, column in columns.items() if name in fields]
+
+def requested_fields(schema: Type[BaseModel]) -> Callable[..., Tuple[str, ...]]:
+    """Dependency parsing a ``fields=`` query parameter against ``schema``.
+
+    Resolves to the requested names in schema order, or to every field of
+    the schema when the parameter is absent. Unknown names are rejected
+    with 400.
+    """
+    names = tuple(schema.model_fields)
+
+    def dependency(
+        fields: Optional[str] = Query(
+            None,
+            description="Comma-separated fields to return; all when omitted"
+        )
+    ) -> Tuple[str, ...]:
+        if fields is None:
+            return names
+        requested = {name.strip() for name in fields.split(",")} - {""}
+        unknown = requested.difference(names)
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}" if unknown else "No fields requested"
+            )
+        return tuple(name for name in names if name in requested)
+
+    return dependency
+
+def project(rows: List[Dict], fields: Tuple[str, ...]) -> List[Dict]:
+    """Trim rows to ``fields``, dropping columns only needed server-side."""
+    if not rows or len(rows[0]) == len(fields):
+        return rows
+    return [{name: row[name] for name in fields} for row in rows]
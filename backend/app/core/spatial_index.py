@@ -0,0 +1,203 @@
+import threading
+import time
+from math import floor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.distance import haversine_miles, nearest_within
+from app.core.geo import bounding_box
+
+# Rough memory cost of one indexed point: the id -> (lat, lon, cell) entry,
+# the grid cell entry and the float/tuple objects behind them.
+BYTES_PER_ENTRY = 320
+
+class SpatialIndex:
+    """In-memory uniform grid of points answering radius and k-nearest queries.
+
+    Points are bucketed into square cells of ``cell_degrees``; a query only
+    measures the points in the cells overlapping its bounding box. When the
+    number of points would exceed ``memory_budget_bytes`` the index marks
+    itself as not ready and callers fall back to the database.
+
+    ``generation`` goes up with every change to the contents, so callers
+    can tell whether two answers came from the same snapshot.
+
+    Updates made while a rebuild reads its rows are logged and replayed
+    onto the new contents, so an older snapshot never undoes them.
+    """
+
+    def __init__(self, cell_degrees: float, memory_budget_bytes: int):
+        self.cell_degrees = cell_degrees
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_entries = memory_budget_bytes // BYTES_PER_ENTRY
+        self.ready = False
+        self.over_budget = False
+        self.last_rebuild_seconds = None
+        self.last_rebuild_at = None
+        self.generation = 0
+        self.queries = 0
+        self._lock = threading.RLock()
+        self._points: Dict[int, Tuple[float, float, Tuple[int, int]]] = {}
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        # (id, (lat, lon)) upserts and (id, None) removals since the running
+        # rebuild started reading, or None when no rebuild is running
+        self._pending: Optional[List[Tuple[int, Optional[Tuple[float, float]]]]] = None
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return floor(latitude / self.cell_degrees), floor(longitude / self.cell_degrees)
+
+    def _overflow(self):
+        # A partial index would silently drop results, so stop serving
+        self.ready = False
+        self.over_budget = True
+        self._points = {}
+        self._cells = {}
+        self.generation += 1
+
+    def rebuild(self, rows: Iterable[Tuple[int, float, float]]):
+        """Replace the contents of the index with ``(id, lat, lon)`` rows.
+
+        ``rows`` may be a lazy query; it is read after update logging starts.
+        """
+        start = time.monotonic()
+        with self._lock:
+            self._pending = []
+        try:
+            points = {}
+            cells = {}
+            for point_id, latitude, longitude in rows:
+                if len(points) >= self.max_entries:
+                    with self._lock:
+                        self._overflow()
+                    return
+                cell = self._cell(latitude, longitude)
+                points[point_id] = (latitude, longitude, cell)
+                cells.setdefault(cell, {})[point_id] = (latitude, longitude)
+
+            with self._lock:
+                self._points = points
+                self._cells = cells
+                self.ready = True
+                self.over_budget = False
+                for point_id, location in self._pending:
+                    if location is None:
+                        self._discard(point_id)
+                    elif not self._insert(point_id, *location):
+                        return
+                self.last_rebuild_seconds = time.monotonic() - start
+                self.last_rebuild_at = time.time()
+                self.generation += 1
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def upsert(self, point_id: int, latitude: float, longitude: float):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((point_id, (latitude, longitude)))
+            if self.ready:
+                self._insert(point_id, latitude, longitude)
+
+    def remove(self, point_id: int):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((point_id, None))
+            self._discard(point_id)
+
+    def _insert(self, point_id: int, latitude: float, longitude: float) -> bool:
+        self._discard(point_id)
+        if len(self._points) >= self.max_entries:
+            self._overflow()
+            return False
+        cell = self._cell(latitude, longitude)
+        self._points[point_id] = (latitude, longitude, cell)
+        self._cells.setdefault(cell, {})[point_id] = (latitude, longitude)
+        self.generation += 1
+        return True
+
+    def _discard(self, point_id: int):
+        entry = self._points.pop(point_id, None)
+        if entry is None:
+            return
+        bucket = self._cells[entry[2]]
+        del bucket[point_id]
+        if not bucket:
+            del self._cells[entry[2]]
+        self.generation += 1
+
+    def _candidates(self, latitude: float, longitude: float, radius_miles: float):
+        min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius_miles)
+        min_row, max_row = floor(min_lat / self.cell_degrees), floor(max_lat / self.cell_degrees)
+        ids, latitudes, longitudes = [], [], []
+        with self._lock:
+            if (max_row - min_row + 1) * sum(
+                floor(max_lon / self.cell_degrees) - floor(min_lon / self.cell_degrees) + 1
+                for min_lon, max_lon in lon_ranges
+            ) > len(self._cells):
+                # Cheaper to scan the occupied cells than every cell in range
+                buckets = self._cells.values()
+            else:
+                buckets = [
+                    self._cells[(row, column)]
+                    for row in range(min_row, max_row + 1)
+                    for min_lon, max_lon in lon_ranges
+                    for column in range(
+                        floor(min_lon / self.cell_degrees),
+                        floor(max_lon / self.cell_degrees) + 1
+                    )
+                    if (row, column) in self._cells
+                ]
+            for bucket in buckets:
+                for point_id, (lat, lon) in bucket.items():
+                    ids.append(point_id)
+                    latitudes.append(lat)
+                    longitudes.append(lon)
+            self.queries += 1
+        return ids, latitudes, longitudes
+
+    def within(self, latitude: float, longitude: float, radius_miles: float) -> List[Tuple[int, float]]:
+        """Return ``(id, miles)`` pairs inside a radius, ordered by (miles, id)."""
+        ids, latitudes, longitudes = self._candidates(latitude, longitude, radius_miles)
+        if not ids:
+            return []
+        distances = haversine_miles(latitude, longitude, latitudes, longitudes)
+        return [
+            (ids[i], float(distances[i]))
+            for i in nearest_within(distances, radius_miles, ids)
+        ]
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        max_radius_miles: Optional[float] = None
+    ) -> List[Tuple[int, float]]:
+        """Return the ``k`` nearest ``(id, miles)`` pairs, nearest first.
+
+        The search radius starts at one cell and doubles until ``k`` points
+        are found or ``max_radius_miles`` is reached.
+        """
+        radius = self.cell_degrees * 69.0
+        while True:
+            if max_radius_miles is not None:
+                radius = min(radius, max_radius_miles)
+            found = self.within(latitude, longitude, radius)
+            if len(found) >= k or radius == max_radius_miles or radius >= 12_500:
+                return found[:k]
+            radius *= 2
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._points)
+            return {
+                "ready": self.ready,
+                "entries": entries,
+                "cells": len(self._cells),
+                "estimated_bytes": entries * BYTES_PER_ENTRY,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "over_budget": self.over_budget,
+                "last_rebuild_seconds": self.last_rebuild_seconds,
+                "last_rebuild_at": self.last_rebuild_at,
+                "generation": self.generation,
+                "queries": self.queries,
+            }
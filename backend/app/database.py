@@ -1,21 +1,253 @@
 import os
-from peewee import PostgresqlDatabase, Model
-from datetime import datetime
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+import peewee
+from peewee import Model
+from playhouse.pool import PooledPostgresqlDatabase, MaxConnectionsExceeded
 import logging
 
+from app.core.config import settings
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-request connection state. Peewee keeps its connection state in a
+# thread-local by default, which is shared by every request running on the
+# event loop thread. Storing it in a context variable gives each request its
+# own connection, borrowed from the pool and returned when the request ends.
+# A context that has no state yet gets its own on first use rather than a
+# shared default.
+database_state = ContextVar("db_state", default=None)
+
+def new_db_state():
+    return {"closed": True, "conn": None, "ctx": [], "transactions": []}
+
+class PeeweeConnectionState(peewee._ConnectionState):
+    """Connection state stored in the current context instead of the thread."""
+
+    def __init__(self, **kwargs):
+        # No reset() here: it would create a state in the importing context
+        # that every context copied from it would then share
+        super().__setattr__("_state", database_state)
+
+    def _current(self):
+        state = self._state.get()
+        if state is None:
+            state = new_db_state()
+            self._state.set(state)
+        return state
+
+    def __setattr__(self, name, value):
+        self._current()[name] = value
+
+    def __getattr__(self, name):
+        return self._current()[name]
+
+class PoolStats:
+    """Thread-safe counters describing connection pool usage."""
+
+    def __init__(self, window_seconds=60):
+        self._lock = threading.Lock()
+        self._window_seconds = window_seconds
+        # (second, checkouts) buckets used to compute the checkout rate
+        self._buckets = deque(maxlen=window_seconds)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.stale = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait):
+        now = int(time.time())
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if self._buckets and self._buckets[-1][0] == now:
+                self._buckets[-1][1] += 1
+            else:
+                self._buckets.append([now, 1])
+
+    def record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def checkouts_per_second(self):
+        cutoff = int(time.time()) - self._window_seconds
+        with self._lock:
+            recent = sum(count for second, count in self._buckets if second > cutoff)
+        return recent / self._window_seconds
+
+    def as_dict(self):
+        with self._lock:
+            checkouts = self.checkouts
+            data = {
+                "checkouts": checkouts,
+                "timeouts": self.timeouts,
+                "connections_created": self.created,
+                "connections_recycled": self.recycled,
+                "stale_connections": self.stale,
+                "avg_wait_ms": (self.total_wait / checkouts * 1000) if checkouts else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+        data["checkouts_per_second"] = self.checkouts_per_second()
+        return data
+
+class MonitoredPooledPostgresqlDatabase(PooledPostgresqlDatabase):
+    """Bounded Postgres connection pool with idle recycling and stale checks.
+
+    Connections idle in the pool for longer than ``idle_timeout`` are closed
+    instead of being handed out again, and connections idle for longer than
+    ``check_interval`` are pinged before use so a connection dropped by the
+    server is replaced transparently.
+    """
+
+    def __init__(self, database, idle_timeout=None, check_interval=None, **kwargs):
+        self._idle_timeout = idle_timeout
+        self._check_interval = check_interval
+        self._returned_at = {}
+        self.stats = PoolStats()
+        super().__init__(database, **kwargs)
+
+    def connect(self, reuse_if_open=False):
+        start = time.monotonic()
+        try:
+            opened = super().connect(reuse_if_open)
+        except MaxConnectionsExceeded:
+            self.stats.record("timeouts")
+            raise
+        if opened:
+            self.stats.record_checkout(time.monotonic() - start)
+        return opened
+
+    def _connect(self):
+        while True:
+            conn = super()._connect()
+            returned_at = self._returned_at.pop(self.conn_key(conn), None)
+            if returned_at is None:
+                # Nothing was available in the pool, so this is a new connection.
+                self.stats.record("created")
+                return conn
+
+            idle = time.time() - returned_at
+            if self._idle_timeout and idle > self._idle_timeout:
+                self.stats.record("recycled")
+            elif self._check_interval and idle > self._check_interval and not self._ping(conn):
+                self.stats.record("stale")
+            else:
+                return conn
+
+            # Discard the connection and try the next one in the pool.
+            self._in_use.pop(self.conn_key(conn), None)
+            self._close(conn, close_conn=True)
+
+    def _close(self, conn, close_conn=False):
+        key = self.conn_key(conn)
+        checking_in = not close_conn and key in self._in_use
+        super()._close(conn, close_conn)
+        # The pool may have closed the connection at check-in (stale_timeout)
+        # instead of keeping it; only time the ones it actually kept
+        if checking_in and any(pooled is conn for _, pooled in self._connections):
+            self._returned_at[key] = time.time()
+        else:
+            self._returned_at.pop(key, None)
+
+    def close_all(self):
+        super().close_all()
+        with self._lock:
+            self._returned_at.clear()
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding stale database connection: {e}")
+            return False
+
+    def pool_stats(self):
+        """Return live statistics about the connection pool."""
+        return {
+            "max_connections": self._max_connections,
+            "in_use": len(self._in_use),
+            "idle": len(self._connections),
+            **self.stats.as_dict(),
+        }
+
 # Initialize database with all necessary parameters
-db = PostgresqlDatabase(
-    'enbysocial',
-    user='postgres',
-    password='postgres',
-    host='db',
-    port=5432,
-    autocommit=True
+db = MonitoredPooledPostgresqlDatabase(
+    settings.DB_NAME,
+    user=settings.DB_USER,
+    password=settings.DB_PASSWORD,
+    host=settings.DB_HOST,
+    port=settings.DB_PORT,
+    max_connections=settings.DB_POOL_MAX_CONNECTIONS,
+    stale_timeout=settings.DB_POOL_STALE_TIMEOUT,
+    timeout=settings.DB_POOL_TIMEOUT,
+    idle_timeout=settings.DB_POOL_IDLE_TIMEOUT,
+    check_interval=settings.DB_POOL_CHECK_INTERVAL,
 )
+db._state = PeeweeConnectionState()
+
+# Fields whose values are rendered with isoformat()
+TEMPORAL_FIELDS = (peewee.DateTimeField, peewee.DateField, peewee.TimeField, peewee.TimestampField)
+
+class RowSerializer:
+    """Converts rows of one model to plain dictionaries.
+
+    Which fields to emit and which of them hold dates is worked out once,
+    so converting a row is a dictionary lookup per field. Rows may be model
+    instances or the dictionaries returned by ``.dicts()``. Foreign keys
+    come out as the related id, read from the row's own data so no related
+    row is ever fetched.
+    """
+
+    __slots__ = ("fields", "temporal")
+
+    def __init__(self, model, fields=None):
+        model_fields = model._meta.fields
+        if fields is None:
+            fields = tuple(model_fields)
+        unknown = [name for name in fields if name not in model_fields]
+        if unknown:
+            raise ValueError(f"{model.__name__} has no fields {', '.join(unknown)}")
+        self.fields = tuple(fields)
+        self.temporal = tuple(
+            name for name in self.fields
+            if isinstance(model_fields[name], TEMPORAL_FIELDS)
+        )
+
+    def __call__(self, row):
+        return self.many((row,))[0]
+
+    def many(self, rows):
+        """Convert a whole result set."""
+        fields = self.fields
+        temporal = self.temporal
+        result = []
+        append = result.append
+        for row in rows:
+            data = row if isinstance(row, dict) else row.__data__
+            item = {name: data.get(name) for name in fields}
+            for name in temporal:
+                value = item[name]
+                if value is not None:
+                    item[name] = value.isoformat()
+            append(item)
+        return result
+
+@functools.lru_cache(maxsize=None)
+def _row_serializer(model, fields):
+    return RowSerializer(model, fields)
 
 class BaseModel(Model):
     """Base model class with common functionality."""
@@ -24,38 +256,70 @@ class BaseModel(Model):
         database = db
         legacy_table_names = False  # Use the exact table names we specify
 
-    def to_dict(self):
+    @classmethod
+    def serializer(cls, fields=None):
+        """The model's RowSerializer for ``fields``, built on first use."""
+        return _row_serializer(cls, tuple(fields) if fields is not None else None)
+
+    @classmethod
+    def to_dicts(cls, rows, fields=None):
+        """Convert many rows of this model to dictionaries."""
+        return cls.serializer(fields).many(rows)
+
+    def to_dict(self, fields=None):
         """Convert model instance to dictionary."""
-        data = {}
-        for field in self._meta.fields:
-            value = getattr(self, field)
-            if isinstance(value, datetime):
-                value = value.isoformat()
-            elif isinstance(value, Model):
-                value = value.id
-            data[field] = value
-        return data
+        return self.serializer(fields)(self)
 
 def init_db():
     """Initialize database tables."""
     try:
-        from app.models.user import User, PersonalAd, Message
+        from app.models.user import User, PersonalAd, Message, UnreadCount, TableVersion
         
         logger.info("Creating database tables...")
-        # Close any existing connection
-        if not db.is_closed():
-            db.close()
-        
-        # Connect and create tables
-        db.connect()
-        with db.atomic():
-            db.create_tables([User, PersonalAd, Message], safe=True)
+        # Borrow a connection from the pool and create tables
+        with db.connection_context():
+            with db.atomic():
+                db.create_tables([User, PersonalAd, Message, UnreadCount, TableVersion], safe=True)
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error creating tables: {e}")
         raise
+
+def reset_db_state():
+    """Give the current context a fresh, closed connection state."""
+    database_state.set(new_db_state())
+
+# Blocking peewee calls run here instead of on the event loop. Each call
+# returns the connection it borrowed before its thread is freed, so a thread
+# waiting for a connection never waits on a job queued behind it.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_WORKERS,
+    thread_name_prefix="db"
+)
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database call without stalling the event loop.
+
+    The call runs in a copy of the current context, so it shares the
+    caller's connection state. A connection the call borrows from the pool
+    is returned as soon as it finishes: holding one across awaits would let
+    requests waiting for a thread keep connections from the threads waiting
+    for a connection. A connection the caller opened itself stays open.
+    """
+    loop = asyncio.get_running_loop()
+    if database_state.get() is None:
+        # Created here, not in the copy, so caller and call share it
+        reset_db_state()
+    context = copy_context()
+    call = functools.partial(context.run, _call_and_release, func, *args, **kwargs)
+    return await loop.run_in_executor(db_executor, call)
+
+def _call_and_release(func, *args, **kwargs):
+    borrowed = db.is_closed()
+    try:
+        return func(*args, **kwargs)
     finally:
-        if not db.is_closed():
+        if borrowed and not db.is_closed():
             db.close()
 
 # Initialize connection handler
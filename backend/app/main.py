@@ -1,15 +1,22 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import logging
+import psycopg2
 
-from app.database import db, init_db
+from app.core.compression import CompressionMiddleware, CompressionStats
+from app.core.config import settings
+from app.core.security import password_hasher
+from app.database import db, db_executor, init_db, reset_db_state, run_db
 from app.routers import user, personal_ads, messages
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Enby Social API")
+# orjson renders every JSON response; list endpoints also hand it plain rows
+app = FastAPI(title="Enby Social API", default_response_class=ORJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -20,17 +27,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses with brotli or gzip
+compression_stats = CompressionStats()
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    stats=compression_stats,
+)
+
 @app.middleware("http")
 async def db_session_middleware(request: Request, call_next):
-    """Manage database connections for each request."""
+    """Give each request its own connection state.
+
+    Queries run through run_db, which returns each connection to the pool
+    as soon as its call finishes; anything the request opened by other
+    means is returned once it ends.
+    """
+    reset_db_state()
     try:
-        # Close any existing connection
-        if not db.is_closed():
-            db.close()
-        
-        # Connect for this request
-        db.connect()
-        
         # Process request
         response = await call_next(request)
         return response
@@ -38,27 +54,65 @@ async def db_session_middleware(request: Request, call_next):
         logger.error(f"Database connection error: {e}")
         return Response("Database connection error", status_code=500)
     finally:
+        # Checking a connection back in never blocks, so no executor thread
         if not db.is_closed():
             db.close()
 
+async def refresh_ad_index():
+    """Periodically rebuild the spatial index to pick up other workers' writes."""
+    while True:
+        await asyncio.sleep(settings.SPATIAL_INDEX_REBUILD_SECONDS)
+        reset_db_state()
+        try:
+            await run_db(personal_ads.load_ad_index)
+        except Exception as e:
+            logger.error(f"Spatial index rebuild failed: {e}")
+
+background_tasks = []
+
 # Startup and shutdown events
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
     logger.info("Starting up application...")
     try:
-        init_db()
+        await run_db(init_db)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Startup error: {e}")
         raise
 
+    if settings.SPATIAL_INDEX_ENABLED:
+        reset_db_state()
+        await run_db(personal_ads.load_ad_index)
+        stats = personal_ads.ad_index.stats()
+        logger.info(
+            f"Spatial index built with {stats['entries']} ads "
+            f"in {stats['last_rebuild_seconds']}s"
+        )
+        background_tasks.append(asyncio.create_task(refresh_ad_index()))
+
+    background_tasks.append(asyncio.create_task(messages.manager.heartbeat()))
+
+    if settings.WS_PUBSUB_ENABLED:
+        # The listener holds its own connection for the worker's lifetime,
+        # outside the request pool
+        await messages.event_bridge.start(
+            lambda: psycopg2.connect(database=db.database, **db.connect_params),
+            reconnect_seconds=settings.WS_PUBSUB_RECONNECT_SECONDS
+        )
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up database connections on shutdown."""
     logger.info("Shutting down application...")
-    if not db.is_closed():
-        db.close()
+    for task in background_tasks:
+        task.cancel()
+    await messages.event_bridge.stop()
+    await messages.message_batcher.drain()
+    db.close_all()
+    db_executor.shutdown(wait=False)
+    password_hasher.shutdown()
 
 # Include routers
 app.include_router(user.router)
@@ -77,24 +131,35 @@ async def root():
 async def health_check():
     """Health check endpoint."""
     try:
-        # Test database connection
-        if not db.is_closed():
-            db.close()
-        db.connect()
-        db.execute_sql('SELECT 1')
+        # Test a pooled database connection
+        await run_db(db.execute_sql, 'SELECT 1')
         db_status = "connected"
     except Exception as e:
         logger.error(f"Health check error: {e}")
         db_status = "error"
-    finally:
-        if not db.is_closed():
-            db.close()
     
     return {
         "status": "healthy",
         "database": db_status
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime statistics for capacity planning."""
+    return {
+        "database_pool": db.pool_stats(),
+        "user_cache": user.user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "message_batching": messages.message_batcher.stats(),
+        "websockets": messages.manager.stats(),
+        "websocket_events": messages.event_bridge.stats(),
+        "compression": compression_stats.as_dict(),
+        "spatial_index": {
+            "enabled": settings.SPATIAL_INDEX_ENABLED,
+            **personal_ads.ad_index.stats()
+        }
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,11 +1,12 @@
 from datetime import datetime
 from peewee import *
+from app.core.geo import location_geohash
 from app.database import BaseModel
 
 class User(BaseModel):
     id = AutoField()
-    username = CharField(unique=True, null=False)
-    email = CharField(unique=True, null=False)
+    username = CharField(null=False)
+    email = CharField(null=False)
     password_hash = CharField(null=False)
     profile_picture = CharField(null=True)
     created_at = TimestampField(null=False, default=datetime.now)
@@ -13,31 +14,43 @@ class User(BaseModel):
     latitude = DoubleField(null=True)
     longitude = DoubleField(null=True)
     last_location_update = TimestampField(null=True)
+    geohash = CharField(max_length=12, null=True)
 
     class Meta:
         table_name = "user"
+        # Authenticated users may be rebuilt from a cached row; writing only
+        # the changed columns keeps stale cached values out of the table
+        only_save_dirty = True
+
+    def save(self, *args, **kwargs):
+        # Keep the proximity key in step with the coordinates
+        if self._pk is None or self._dirty & {'latitude', 'longitude'}:
+            self.geohash = location_geohash(self.latitude, self.longitude)
+        return super().save(*args, **kwargs)
 
 class PersonalAd(BaseModel):
     id = AutoField()
-    user = ForeignKeyField(model=User, backref='personal_ads', on_delete='CASCADE')
+    user = ForeignKeyField(model=User, backref='personal_ads', on_delete='CASCADE', index=False)
     content = TextField(null=False)
     created_at = TimestampField(null=False, default=datetime.now)
     updated_at = TimestampField(null=False, default=datetime.now)
     latitude = DoubleField(null=False)
     longitude = DoubleField(null=False)
     is_active = BooleanField(null=False, default=True)
+    geohash = CharField(max_length=12, null=True)
 
     class Meta:
         table_name = "personalad"
-        indexes = (
-            (('user_id',), False),
-            (('is_active',), False),
-        )
+
+    def save(self, *args, **kwargs):
+        # Keep the proximity key in step with the coordinates
+        self.geohash = location_geohash(self.latitude, self.longitude)
+        return super().save(*args, **kwargs)
 
 class Message(BaseModel):
     id = AutoField()
-    sender = ForeignKeyField(model=User, backref='sent_messages', on_delete='CASCADE')
-    receiver = ForeignKeyField(model=User, backref='received_messages', on_delete='CASCADE')
+    sender = ForeignKeyField(model=User, backref='sent_messages', on_delete='CASCADE', index=False)
+    receiver = ForeignKeyField(model=User, backref='received_messages', on_delete='CASCADE', index=False)
     content = TextField(null=False)
     created_at = TimestampField(null=False, default=datetime.now)
     is_read = BooleanField(null=False, default=False)
@@ -45,8 +58,71 @@ class Message(BaseModel):
 
     class Meta:
         table_name = "message"
-        indexes = (
-            (('sender_id',), False),
-            (('receiver_id',), False),
-            (('is_read',), False),
-        )
+
+# Indexes carry the names the migrations create them under, so that
+# create_tables(safe=True) finds them rather than adding identical copies
+User.add_index(User.username, unique=True, name='user_username_key')
+User.add_index(User.email, unique=True, name='user_email_key')
+User.add_index(User.geohash, name='idx_user_geohash')
+PersonalAd.add_index(PersonalAd.user, name='idx_personalad_user_id')
+PersonalAd.add_index(PersonalAd.is_active, name='idx_personalad_is_active')
+PersonalAd.add_index(
+    PersonalAd.is_active, PersonalAd.latitude, PersonalAd.longitude,
+    name='idx_personalad_active_location'
+)
+PersonalAd.add_index(PersonalAd.is_active, PersonalAd.geohash, name='idx_personalad_active_geohash')
+PersonalAd.add_index(
+    PersonalAd.is_active, PersonalAd.created_at.desc(), PersonalAd.id.desc(),
+    name='idx_personalad_active_created'
+)
+PersonalAd.add_index(
+    PersonalAd.user, PersonalAd.created_at.desc(), PersonalAd.id.desc(),
+    name='idx_personalad_user_created'
+)
+Message.add_index(Message.sender, name='idx_message_sender_id')
+Message.add_index(Message.receiver, name='idx_message_receiver_id')
+Message.add_index(Message.is_read, name='idx_message_is_read')
+Message.add_index(
+    Message.sender, Message.receiver, Message.id,
+    name='idx_message_sender_receiver'
+)
+
+class UnreadCount(BaseModel):
+    """Number of unread messages a receiver has from each sender.
+
+    Maintained alongside Message by the send and mark-read paths so unread
+    totals are read per conversation rather than counted per message.
+    """
+    receiver = ForeignKeyField(model=User, on_delete='CASCADE')
+    sender = ForeignKeyField(model=User, on_delete='CASCADE')
+    unread = IntegerField(null=False, default=0)
+
+    class Meta:
+        table_name = "unreadcount"
+        primary_key = CompositeKey('receiver', 'sender')
+
+class TableVersion(BaseModel):
+    """Change counter of a table, for tagging responses built from it.
+
+    Bumped by the write paths after every change readers would see, so a
+    reader learns whether anything changed from one primary key lookup
+    rather than by scanning the rows.
+    """
+    name = CharField(primary_key=True)
+    version = BigIntegerField(null=False, default=0)
+
+    class Meta:
+        table_name = "tableversion"
+
+    @classmethod
+    def bump(cls, name: str):
+        (cls
+            .insert(name=name, version=1)
+            .on_conflict(
+                conflict_target=[cls.name],
+                update={cls.version: cls.version + 1})
+            .execute())
+
+    @classmethod
+    def current(cls, name: str) -> int:
+        return cls.select(cls.version).where(cls.name == name).scalar() or 0
@@ -1,111 +1,397 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Query, status, WebSocket
+from fastapi.responses import ORJSONResponse
+from collections import Counter, defaultdict
+from typing import List, Optional, Tuple
 from datetime import datetime
+from peewee import EXCLUDED, Case, fn
 
-from app.models.user import User, Message
-from app.schemas.user import MessageCreate, MessageResponse
-from app.routers.user import get_current_user
+from app.core.batching import WriteBatcher
+from app.core.config import settings
+from app.core.connections import ClientConnection, ConnectionManager
+from app.core.events import ACK, ERROR, MESSAGES_READ, NEW_MESSAGE, PONG, Event, negotiate
+from app.core.pubsub import EventBridge
+from app.core.serialization import pick_columns, requested_fields, schema_columns
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.database import db, reset_db_state, run_db
+from app.models.user import User, Message, UnreadCount
+from app.schemas.user import (
+    ConversationResponse, MessageCreate, MessageResponse, MessageSendFrame, MessagesRead,
+    UnreadCountResponse
+)
+from app.routers.user import get_current_user, user_from_token
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+DEFAULT_CONVERSATION_PAGE_SIZE = 20
+MAX_CONVERSATION_PAGE_SIZE = 100
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
 
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
+# Columns of MessageResponse; list endpoints fetch rows as dicts of these
+MESSAGE_COLUMNS = schema_columns(Message, MessageResponse)
 
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+message_fields = requested_fields(MessageResponse)
 
-    async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(message)
+# WebSocket connections of the users connected to this worker
+manager = ConnectionManager(
+    queue_size=settings.WS_MESSAGE_QUEUE_SIZE,
+    max_coalesce=settings.WS_COALESCE_MAX_EVENTS,
+    max_connections=settings.WS_MAX_CONNECTIONS,
+    heartbeat_interval=settings.WS_HEARTBEAT_SECONDS,
+    idle_timeout=settings.WS_IDLE_TIMEOUT_SECONDS,
+    handshake_concurrency=settings.WS_HANDSHAKE_CONCURRENCY,
+    handshake_timeout=settings.WS_HANDSHAKE_TIMEOUT_SECONDS
+)
+# Reaches sockets connected to the other workers as well
+event_bridge = EventBridge(manager)
 
-manager = ConnectionManager()
+def create_messages(batch: List[Tuple[User, int, str]]) -> List[Optional[Message]]:
+    """Store a batch of (sender, receiver_id, content) messages.
+
+    All rows go in with one multi-row INSERT ... RETURNING and the unread
+    counters get one upsert per conversation, in a single transaction.
+    Messages whose receiver does not exist are skipped and come back as None.
+    """
+    receiver_ids = {receiver_id for _, receiver_id, _ in batch}
+    now = datetime.now()
+    with Message._meta.database.atomic():
+        existing = {user.id for user in User.select(User.id).where(User.id.in_(receiver_ids))}
+        rows = [
+            {
+                "sender": sender.id,
+                "receiver": receiver_id,
+                "content": content,
+                "created_at": now,
+                "is_read": False,
+            }
+            for sender, receiver_id, content in batch
+            if receiver_id in existing
+        ]
+        if not rows:
+            return [None] * len(batch)
+
+        # Postgres does not promise RETURNING rows in VALUES order, so they
+        # are matched back on their columns. Identical messages in one batch
+        # are interchangeable; they get their ids in ascending order.
+        returned = defaultdict(list)
+        inserted = (Message
+            .insert_many(rows)
+            .returning(Message.id, Message.sender, Message.receiver, Message.content)
+            .tuples()
+            .execute())
+        for message_id, sender_id, receiver_id, content in inserted:
+            returned[(sender_id, receiver_id, content)].append(message_id)
+        for message_ids in returned.values():
+            message_ids.sort(reverse=True)
+        ids = [returned[(row["sender"], row["receiver"], row["content"])].pop() for row in rows]
+
+        unread = Counter((row["receiver"], row["sender"]) for row in rows)
+        (UnreadCount
+            .insert_many([
+                {"receiver": receiver_id, "sender": sender_id, "unread": count}
+                for (receiver_id, sender_id), count in unread.items()
+            ])
+            .on_conflict(
+                conflict_target=[UnreadCount.receiver, UnreadCount.sender],
+                update={UnreadCount.unread: UnreadCount.unread + EXCLUDED.unread})
+            .execute())
+
+    messages = iter(Message(id=message_id, read_at=None, **row) for message_id, row in zip(ids, rows))
+    return [
+        next(messages) if receiver_id in existing else None
+        for _, receiver_id, _ in batch
+    ]
+
+# Concurrent sends are written together, one transaction per batch
+message_batcher = WriteBatcher(
+    create_messages,
+    max_batch_size=settings.MESSAGE_BATCH_MAX_SIZE,
+    window_seconds=settings.MESSAGE_BATCH_WINDOW_MS / 1000
+)
+
+def mark_read(receiver_id: int, sender_id: int, *conditions) -> int:
+    """Mark a receiver's unread messages from a sender as read.
+
+    ``conditions`` narrow down which of the messages are marked. The unread
+    counter is decremented by the number of rows actually flipped, in the
+    same transaction, so it never drifts from the message table.
+    """
+    with Message._meta.database.atomic():
+        updated = (Message
+            .update(is_read=True, read_at=datetime.now())
+            .where(
+                (Message.sender == sender_id) &
+                (Message.receiver == receiver_id) &
+                (Message.is_read == False),
+                *conditions)
+            .execute())
+        if updated:
+            (UnreadCount
+                .update(unread=UnreadCount.unread - updated)
+                .where(
+                    (UnreadCount.receiver == receiver_id) &
+                    (UnreadCount.sender == sender_id))
+                .execute())
+    return updated
+
+def new_message_event(message: Message, sender: User) -> Event:
+    """Event pushed to a receiver's sockets when a message arrives."""
+    return Event(NEW_MESSAGE, {
+        "id": message.id,
+        "sender_id": sender.id,
+        "sender_username": sender.username,
+        "receiver_id": message.receiver_id,
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+        "is_read": False,
+    })
+
+async def handle_frame(connection: ClientConnection, user: User, data):
+    """Handle a frame sent by a client over its socket.
+
+    A send frame is stored, acked and forwarded. The ack goes to the
+    connection that sent the frame and carries the client's id, so the
+    client can match it with the message it showed. Pongs only need to
+    reach the server, which marks the connection as alive.
+    """
+    connection.touch()
+    try:
+        payload = connection.codec.loads(data)
+        if isinstance(payload, dict) and payload.get("type") == PONG:
+            return
+        # Validation errors are ValueErrors too
+        frame = MessageSendFrame.model_validate(payload)
+    except (ValueError, TypeError):
+        manager.send(connection, Event(ERROR, {"detail": "Invalid frame"}))
+        return
+
+    try:
+        message = await message_batcher.submit((user, frame.receiver_id, frame.content))
+    except Exception:
+        # The batcher has logged the failed write; the socket stays usable
+        manager.send(connection, Event(ERROR, {
+            "client_id": frame.client_id,
+            "detail": "Message could not be sent"
+        }))
+        return
+
+    if message is None:
+        manager.send(connection, Event(ERROR, {
+            "client_id": frame.client_id,
+            "detail": "Receiver not found"
+        }))
+        return
+
+    manager.send(connection, Event(ACK, {
+        "client_id": frame.client_id,
+        "id": message.id,
+        "created_at": message.created_at.isoformat()
+    }))
+    await event_bridge.send(frame.receiver_id, new_message_event(message, user))
 
 @router.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
+    # Turned away before any work is done on its behalf
+    if not manager.reserve():
+        await manager.reject(websocket)
+        return
+
+    connection = None
+    try:
+        async with manager.admission() as admitted:
+            if not admitted:
+                await manager.reject(websocket)
+                return
+            # WebSockets bypass the HTTP middleware, so a connection is borrowed
+            # only if the user is not cached, and only for the handshake
+            reset_db_state()
+            try:
+                user = await user_from_token(token)
+            except HTTPException:
+                # Accepted first so the client gets 1008 rather than a 403
+                await websocket.accept()
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+            finally:
+                if not db.is_closed():
+                    db.close()
+
+            connection = await manager.connect(
+                websocket,
+                user.id,
+                subprotocol=negotiate(websocket.scope.get("subprotocols", [])),
+                reserved=True
+            )
+    finally:
+        if connection is None:
+            manager.release()
+
     try:
-        # Verify token and get user
-        from app.core.security import verify_token
-        payload = verify_token(token)
-        username = payload.get("sub")
-        user = User.get(User.username == username)
-        
-        await manager.connect(websocket, user.id)
-        
-        try:
-            while True:
-                data = await websocket.receive_text()
-                # Process received message
-                # You might want to parse the data and save it to the database
-                await manager.send_personal_message(f"You wrote: {data}", user.id)
-        except WebSocketDisconnect:
-            manager.disconnect(user.id)
-    except Exception as e:
-        await websocket.close()
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            data = frame.get("bytes") or frame.get("text")
+            await handle_frame(connection, user, data)
+    finally:
+        manager.disconnect(connection)
 
 @router.post("/", response_model=MessageResponse)
 async def send_message(
     message_data: MessageCreate,
     current_user: User = Depends(get_current_user)
 ):
-    try:
-        receiver = User.get(User.id == message_data.receiver_id)
-    except User.DoesNotExist:
+    message = await message_batcher.submit(
+        (current_user, message_data.receiver_id, message_data.content)
+    )
+    if message is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Receiver not found"
         )
 
-    message = Message.create(
-        sender=current_user,
-        receiver=receiver,
-        content=message_data.content
-    )
+    # Queue a real-time notification for the receiver's sockets on every
+    # worker; this never waits on the receiver's socket
+    await event_bridge.send(message_data.receiver_id, new_message_event(message, current_user))
+
+    return message
 
-    # Send real-time notification if receiver is connected
-    if receiver.id in manager.active_connections:
-        await manager.send_personal_message(
-            str({
-                "type": "new_message",
-                "sender_id": current_user.id,
-                "sender_username": current_user.username,
-                "content": message_data.content
-            }),
-            receiver.id
+def conversations_query(user_id: int, before_id: Optional[int], limit: int):
+    """One row per chat partner with the latest message and unread count.
+
+    Messages are grouped by the other participant; the highest message id in
+    each group is the latest message, which is joined back in together with
+    the partner's public profile. Conversations are ordered by that id, most
+    recent first, which also serves as the keyset for pagination.
+    """
+    partner_id = Case(None, [(Message.sender == user_id, Message.receiver)], Message.sender)
+    unread = Case(None, [((Message.receiver == user_id) & (Message.is_read == False), 1)], 0)
+    summary = (Message
+        .select(
+            partner_id.alias("partner_id"),
+            fn.MAX(Message.id).alias("last_id"),
+            fn.SUM(unread).alias("unread_count"))
+        .where((Message.sender == user_id) | (Message.receiver == user_id))
+        .group_by(partner_id))
+    if before_id is not None:
+        summary = summary.having(fn.MAX(Message.id) < before_id)
+
+    LastMessage = Message.alias()
+    return (LastMessage
+        .select(
+            *schema_columns(LastMessage, MessageResponse).values(),
+            summary.c.unread_count,
+            User.id.alias("partner_id"),
+            User.username.alias("partner_username"),
+            User.profile_picture.alias("partner_profile_picture"))
+        .join(summary, on=(LastMessage.id == summary.c.last_id))
+        .join(User, on=(User.id == summary.c.partner_id))
+        .order_by(LastMessage.id.desc())
+        .limit(limit)
+        .dicts())
+
+@router.get("/conversations", response_model=List[ConversationResponse])
+async def get_conversations(
+    limit: int = Query(DEFAULT_CONVERSATION_PAGE_SIZE, ge=1, le=MAX_CONVERSATION_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    before_id = decode_cursor(cursor, int)[0] if cursor else None
+
+    # Fetch one extra row to learn whether another page follows
+    rows = await run_db(list, conversations_query(current_user.id, before_id, limit + 1))
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1]["id"])
+
+    return ORJSONResponse([
+        {
+            "user": {
+                "id": row["partner_id"],
+                "username": row["partner_username"],
+                "profile_picture": row["partner_profile_picture"],
+            },
+            "last_message": {name: row[name] for name in MessageResponse.model_fields},
+            "unread_count": row["unread_count"] or 0,
+        }
+        for row in rows
+    ], headers=headers)
+
+def history_query(
+    user_id: int,
+    other_user_id: int,
+    before_id: Optional[int],
+    limit: int,
+    fields: Tuple[str, ...] = tuple(MESSAGE_COLUMNS)
+):
+    """The latest messages between two users, older than ``before_id``.
+
+    Each direction of the conversation is a separate range scan over the
+    (sender_id, receiver_id, id) index, limited before the two are merged, so
+    a page costs the same however long the conversation is.
+    """
+    def direction(sender_id, receiver_id):
+        query = Message.select(Message.id).where(
+            (Message.sender == sender_id) & (Message.receiver == receiver_id)
         )
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        return query.order_by(Message.id.desc()).limit(limit)
 
-    return message
+    return (Message
+        .select(*pick_columns(MESSAGE_COLUMNS, fields))
+        .where(
+            Message.id.in_(direction(user_id, other_user_id)) |
+            Message.id.in_(direction(other_user_id, user_id)))
+        .order_by(Message.id.desc())
+        .limit(limit)
+        .dicts())
 
 @router.get("/", response_model=List[MessageResponse])
 async def get_messages(
     other_user_id: int,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    fields: Tuple[str, ...] = Depends(message_fields),
     current_user: User = Depends(get_current_user)
 ):
-    try:
-        other_user = User.get(User.id == other_user_id)
-    except User.DoesNotExist:
+    if not await run_db(User.select().where(User.id == other_user_id).exists):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    messages = Message.select().where(
-        (
-            (Message.sender == current_user) & 
-            (Message.receiver == other_user)
-        ) | (
-            (Message.sender == other_user) & 
-            (Message.receiver == current_user)
+    # Newest page first from the database, returned oldest first so the
+    # client can prepend it to what it already shows
+    messages = await run_db(list, history_query(current_user.id, other_user_id, before_id, limit, fields))
+    messages.reverse()
+    return ORJSONResponse(messages)
+
+@router.put("/read")
+async def mark_conversation_as_read(
+    read_data: MessagesRead,
+    current_user: User = Depends(get_current_user)
+):
+    """Mark every message from a user up to a watermark id as read."""
+    updated = await run_db(
+        mark_read,
+        current_user.id,
+        read_data.other_user_id,
+        Message.id <= read_data.up_to_id
+    )
+
+    # One receipt covers the whole batch
+    if updated:
+        await event_bridge.send(
+            read_data.other_user_id,
+            Event(MESSAGES_READ, {
+                "reader_id": current_user.id,
+                "up_to_id": read_data.up_to_id
+            })
         )
-    ).order_by(Message.created_at)
 
-    return list(messages)
+    return {"message": "Messages marked as read", "updated": updated}
 
 @router.put("/{message_id}/read")
 async def mark_message_as_read(
@@ -113,7 +399,8 @@ async def mark_message_as_read(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        message = Message.get(
+        message = await run_db(
+            Message.get,
             (Message.id == message_id) &
             (Message.receiver == current_user)
         )
@@ -124,19 +411,35 @@ async def mark_message_as_read(
         )
 
     if not message.is_read:
-        message.is_read = True
-        message.read_at = datetime.now()
-        message.save()
+        await run_db(mark_read, current_user.id, message.sender_id, Message.id == message.id)
 
     return {"message": "Message marked as read"}
 
 @router.get("/unread", response_model=List[MessageResponse])
 async def get_unread_messages(
+    fields: Tuple[str, ...] = Depends(message_fields),
     current_user: User = Depends(get_current_user)
 ):
-    messages = Message.select().where(
+    messages = Message.select(*pick_columns(MESSAGE_COLUMNS, fields)).where(
         (Message.receiver == current_user) &
         (Message.is_read == False)
-    ).order_by(Message.created_at)
+    ).order_by(Message.created_at).dicts()
+
+    return ORJSONResponse(await run_db(list, messages))
+
+@router.get("/unread/counts", response_model=List[UnreadCountResponse])
+async def get_unread_counts(
+    current_user: User = Depends(get_current_user)
+):
+    """Unread message counts per sender, read from the maintained counters."""
+    counts = (UnreadCount
+        .select(
+            UnreadCount.sender.alias("sender_id"),
+            UnreadCount.unread.alias("unread_count"))
+        .where(
+            (UnreadCount.receiver == current_user.id) &
+            (UnreadCount.unread > 0))
+        .order_by(UnreadCount.sender)
+        .dicts())
 
-    return list(messages)
+    return ORJSONResponse(await run_db(list, counts))
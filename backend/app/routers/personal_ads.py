@@ -1,14 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from geopy.distance import geodesic
+from functools import reduce
+import operator
 
-from app.models.user import User, PersonalAd
+from app.core.conditional import etag_matches, make_etag
+from app.core.config import settings
+from app.core.distance import haversine_miles, nearest_within
+from app.core.geo import bounding_box, geohash_cells, geohash_prefix_range
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_page
+from app.core.serialization import pick_columns, project, requested_fields, schema_columns
+from app.core.spatial_index import SpatialIndex
+from app.database import db, run_db
+from app.models.user import User, PersonalAd, TableVersion
 from app.schemas.user import PersonalAdCreate, PersonalAdResponse, PersonalAdUpdate
 from app.routers.user import get_current_user
 
 router = APIRouter(prefix="/personal-ads", tags=["personal-ads"])
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns of PersonalAdResponse; list endpoints fetch rows as dicts of these.
+# The author's username comes from a join, made only when it is requested.
+AD_COLUMNS = {**schema_columns(PersonalAd, PersonalAdResponse), "username": User.username}
+# Selected whatever fields the client asks for: ids and creation times key
+# the pages and coordinates measure distances
+AD_KEY_FIELDS = ("id", "created_at", "latitude", "longitude")
+
+ad_fields = requested_fields(PersonalAdResponse)
+
+# Optional in-memory index of active ads. Each worker keeps its own copy,
+# updated by the writes it serves and rebuilt periodically to pick up the
+# writes served by other workers.
+ad_index = SpatialIndex(
+    cell_degrees=settings.SPATIAL_INDEX_CELL_DEGREES,
+    memory_budget_bytes=settings.SPATIAL_INDEX_MEMORY_MB * 1024 * 1024
+)
+
 @router.post("/", response_model=PersonalAdResponse)
 async def create_personal_ad(
     ad_data: PersonalAdCreate,
@@ -20,42 +50,273 @@ async def create_personal_ad(
             detail="User location not set"
         )
 
-    personal_ad = PersonalAd.create(
+    personal_ad = await run_db(
+        PersonalAd.create,
         user=current_user,
         content=ad_data.content,
         latitude=current_user.latitude,
         longitude=current_user.longitude
     )
+    await run_db(TableVersion.bump, PersonalAd._meta.table_name)
+    ad_index.upsert(personal_ad.id, personal_ad.latitude, personal_ad.longitude)
     return personal_ad
 
+def load_ad_index():
+    """Rebuild the spatial index from the active ads in the database."""
+    with db.connection_context():
+        ad_index.rebuild(
+            PersonalAd.select(
+                PersonalAd.id,
+                PersonalAd.latitude,
+                PersonalAd.longitude
+            ).where(PersonalAd.is_active == True).tuples()
+        )
+
+def select_ads(fields: Tuple[str, ...]):
+    """Select the columns behind ``fields`` plus the ones the handlers key on."""
+    fields = AD_KEY_FIELDS + fields
+    query = PersonalAd.select(*pick_columns(AD_COLUMNS, fields))
+    if "username" in fields:
+        query = query.join(User)
+    return query
+
+async def ads_in_order(nearby: List[Tuple[int, float]], fields: Tuple[str, ...]) -> List[Dict]:
+    """Fetch ads for ``(id, miles)`` pairs, keeping their order."""
+    if not nearby:
+        return []
+    rows = await run_db(list, select_ads(fields).where(
+        (PersonalAd.id.in_([ad_id for ad_id, _ in nearby])) &
+        (PersonalAd.is_active == True)
+    ).dicts())
+    ads_by_id = {ad["id"]: ad for ad in rows}
+    ads = []
+    for ad_id, ad_distance in nearby:
+        ad = ads_by_id.get(ad_id)
+        if ad is not None:
+            ad["distance"] = ad_distance
+            ads.append(ad)
+    return ads
+
+def annotate_distances(ads: List[Dict], current_user: User):
+    """Set each ad's distance from the user, or None if the user has no location."""
+    if not ads:
+        return
+    if not current_user.latitude or not current_user.longitude:
+        for ad in ads:
+            ad["distance"] = None
+        return
+    distances = haversine_miles(
+        current_user.latitude,
+        current_user.longitude,
+        [ad["latitude"] for ad in ads],
+        [ad["longitude"] for ad in ads]
+    )
+    for ad, ad_distance in zip(ads, distances.tolist()):
+        ad["distance"] = ad_distance
+
+def within_box(current_user: User, distance: float):
+    """Condition matching active ads in the bounding box of a radius around the user.
+
+    Served by the (is_active, latitude, longitude) index.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(
+        current_user.latitude,
+        current_user.longitude,
+        distance
+    )
+    lon_condition = reduce(operator.or_, [
+        PersonalAd.longitude.between(min_lon, max_lon)
+        for min_lon, max_lon in lon_ranges
+    ])
+    return (
+        (PersonalAd.is_active == True) &
+        PersonalAd.latitude.between(min_lat, max_lat) &
+        lon_condition
+    )
+
+async def ads_within_distance(
+    current_user: User,
+    distance: float,
+    fields: Tuple[str, ...]
+) -> List[Dict]:
+    """Active ads within ``distance`` miles of the user, ordered by (distance, id)."""
+    # Narrow the candidates in SQL with a bounding box around the user
+    query = select_ads(fields).where(within_box(current_user, distance))
+    
+    # Resolve the cells around the user through indexed geohash prefix
+    # lookups; the box above then trims the corners of those cells. Rows
+    # the geohash backfill has not reached yet are kept on the box alone.
+    cells = geohash_cells(
+        current_user.latitude,
+        current_user.longitude,
+        distance
+    )
+    if cells:
+        query = query.where(reduce(operator.or_, [
+            PersonalAd.geohash.between(*geohash_prefix_range(cell))
+            for cell in cells
+        ]) | PersonalAd.geohash.is_null())
+    
+    ads = await run_db(list, query.dicts())
+    if not ads:
+        return []
+    
+    # Measure the whole batch at once, keep the ads inside the radius,
+    # nearest first
+    distances = haversine_miles(
+        current_user.latitude,
+        current_user.longitude,
+        [ad["latitude"] for ad in ads],
+        [ad["longitude"] for ad in ads]
+    )
+    nearest = nearest_within(distances, distance, [ad["id"] for ad in ads])
+    ads = [ads[i] for i in nearest]
+    for ad, ad_distance in zip(ads, distances[nearest].tolist()):
+        ad["distance"] = ad_distance
+    return ads
+
+async def newest_first_page(
+    query,
+    limit: int,
+    cursor: Optional[str]
+) -> Tuple[List[Dict], Dict[str, str]]:
+    """Fetch one keyset page of ads ordered newest first by (created_at, id).
+
+    Returns the ads and the response headers pointing at the next page.
+    """
+    query = query.order_by(PersonalAd.created_at.desc(), PersonalAd.id.desc())
+    if cursor:
+        created_at, ad_id = decode_cursor(cursor, str, int)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.where(
+            (PersonalAd.created_at < created_at) |
+            ((PersonalAd.created_at == created_at) & (PersonalAd.id < ad_id))
+        )
+    
+    # Fetch one extra row to learn whether another page follows
+    ads = await run_db(list, query.limit(limit + 1).dicts())
+    headers = {}
+    if len(ads) > limit:
+        ads = ads[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            ads[-1]["created_at"].isoformat(),
+            ads[-1]["id"]
+        )
+    return ads, headers
+
+async def feed_etag(
+    request: Request,
+    current_user: User,
+    index_generation: Optional[int] = None
+) -> str:
+    """Version tag of a feed response.
+
+    Derived from the ad table's version, which every worker bumps after
+    creating, editing or removing an ad and after renaming an author, so a
+    poll costs one primary key lookup however many ads are in range. The
+    query string and the user's location, which distances are measured
+    from, complete the tag. When the spatial index picks the ads, its
+    ``index_generation`` is part of the tag too: the index may lag the
+    database until its next rebuild, and a tag taken from the database
+    alone would keep answering 304 for the lagging page after the rebuild
+    caught up.
+    """
+    version = await run_db(TableVersion.current, PersonalAd._meta.table_name)
+    return make_etag(
+        version,
+        index_generation,
+        current_user.latitude,
+        current_user.longitude,
+        str(request.query_params)
+    )
+
 @router.get("/", response_model=List[PersonalAdResponse])
 async def get_personal_ads(
+    request: Request,
     distance: Optional[float] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Tuple[str, ...] = Depends(ad_fields),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    query = PersonalAd.select().where(PersonalAd.is_active == True)
-    
+    """Active ads, newest first, or nearest first when ``distance`` is given.
+
+    Results are paginated; when more ads follow, the ``X-Next-Cursor``
+    response header holds the cursor for the next page. ``fields`` narrows
+    each ad to the named fields.
+
+    Responses carry an ``ETag``; a client polling the feed sends it back in
+    ``If-None-Match`` and gets an empty 304 while nothing has changed.
+    """
     if distance is not None:
         if not current_user.latitude or not current_user.longitude:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="User location not set"
             )
+    # Read before the page is built, so a change in between only makes the
+    # tag older than the page, never newer
+    index_generation = ad_index.generation if distance is not None and ad_index.ready else None
+    etag = await feed_etag(request, current_user, index_generation)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    if distance is not None:
+        after = decode_cursor(cursor, float, int) if cursor else None
+        if index_generation is not None and ad_index.ready:
+            # Resolve the geometry entirely in memory and only fetch the
+            # rows of the requested page
+            nearby = ad_index.within(
+                current_user.latitude,
+                current_user.longitude,
+                distance
+            )
+            page, next_key = keyset_page(nearby, lambda item: (item[1], item[0]), after, limit)
+            ads = await ads_in_order(page, fields)
+        else:
+            ads = await ads_within_distance(current_user, distance, fields)
+            ads, next_key = keyset_page(ads, lambda ad: (ad["distance"], ad["id"]), after, limit)
         
-        # Get all active ads and filter by distance
-        ads = list(query)
-        filtered_ads = []
-        user_location = (current_user.latitude, current_user.longitude)
-        
-        for ad in ads:
-            ad_location = (ad.latitude, ad.longitude)
-            ad_distance = geodesic(user_location, ad_location).miles
-            if ad_distance <= distance:
-                filtered_ads.append(ad)
-        
-        return filtered_ads
+        headers = {"ETag": etag}
+        if next_key is not None:
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(*next_key)
+        return ORJSONResponse(project(ads, fields), headers=headers)
     
-    return list(query)
+    query = select_ads(fields).where(PersonalAd.is_active == True)
+    ads, headers = await newest_first_page(query, limit, cursor)
+    if "distance" in fields:
+        annotate_distances(ads, current_user)
+    return ORJSONResponse(project(ads, fields), headers={**headers, "ETag": etag})
+
+@router.get("/nearest", response_model=List[PersonalAdResponse])
+async def get_nearest_personal_ads(
+    k: int = Query(20, ge=1, le=100),
+    fields: Tuple[str, ...] = Depends(ad_fields),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.latitude or not current_user.longitude:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User location not set"
+        )
+    
+    if ad_index.ready:
+        ads = await ads_in_order(ad_index.nearest(
+            current_user.latitude,
+            current_user.longitude,
+            k,
+            settings.MAX_RADIUS_MILES
+        ), fields)
+    else:
+        ads = await ads_within_distance(current_user, settings.MAX_RADIUS_MILES, fields)
+    return ORJSONResponse(project(ads[:k], fields))
 
 @router.get("/{ad_id}", response_model=PersonalAdResponse)
 async def get_personal_ad(
@@ -63,7 +324,8 @@ async def get_personal_ad(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        ad = PersonalAd.get(
+        ad = await run_db(
+            PersonalAd.get,
             (PersonalAd.id == ad_id) & 
             (PersonalAd.is_active == True)
         )
@@ -81,7 +343,8 @@ async def update_personal_ad(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        ad = PersonalAd.get(
+        ad = await run_db(
+            PersonalAd.get,
             (PersonalAd.id == ad_id) & 
             (PersonalAd.user == current_user)
         )
@@ -98,7 +361,12 @@ async def update_personal_ad(
         ad.is_active = ad_update.is_active
     
     ad.updated_at = datetime.now()
-    ad.save()
+    await run_db(ad.save)
+    await run_db(TableVersion.bump, PersonalAd._meta.table_name)
+    if ad.is_active:
+        ad_index.upsert(ad.id, ad.latitude, ad.longitude)
+    else:
+        ad_index.remove(ad.id)
     return ad
 
 @router.delete("/{ad_id}")
@@ -107,7 +375,8 @@ async def delete_personal_ad(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        ad = PersonalAd.get(
+        ad = await run_db(
+            PersonalAd.get,
             (PersonalAd.id == ad_id) & 
             (PersonalAd.user == current_user)
         )
@@ -118,16 +387,26 @@ async def delete_personal_ad(
         )
 
     ad.is_active = False
-    ad.save()
+    ad.updated_at = datetime.now()
+    await run_db(ad.save)
+    await run_db(TableVersion.bump, PersonalAd._meta.table_name)
+    ad_index.remove(ad.id)
     return {"message": "Personal ad deleted successfully"}
 
 @router.get("/user/{user_id}", response_model=List[PersonalAdResponse])
 async def get_user_personal_ads(
     user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Tuple[str, ...] = Depends(ad_fields),
     current_user: User = Depends(get_current_user)
 ):
-    ads = PersonalAd.select().where(
+    query = select_ads(fields).where(
         (PersonalAd.user_id == user_id) & 
         (PersonalAd.is_active == True)
     )
-    return list(ads)
+    ads, headers = await newest_first_page(query, limit, cursor)
+    if "distance" in fields:
+        for ad in ads:
+            ad["distance"] = None
+    return ORJSONResponse(project(ads, fields), headers=headers)
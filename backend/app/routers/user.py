@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 
 from app.core.security import (
-    verify_password,
-    get_password_hash,
+    password_hasher,
     create_access_token,
     oauth2_scheme,
     verify_token
 )
-from app.models.user import User
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.serialization import requested_fields
+from app.database import run_db
+from app.models.user import User, PersonalAd, TableVersion
 from app.schemas.user import (
     UserCreate,
     UserResponse,
@@ -20,22 +24,55 @@ from app.schemas.user import (
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Authenticated user rows keyed by token subject (username). Entries are
+# dropped whenever this worker changes the row; the TTL bounds staleness
+# for changes made by other workers.
+user_cache = TTLCache(
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS
+)
+
+def cache_user(user: User):
+    user_cache.set(user.username, dict(user.__data__))
+
+def get_cached_user(username: str) -> Optional[User]:
+    data = user_cache.get(username)
+    if data is None:
+        return None
+    # Build a fresh instance so request handlers never share mutable state
+    user = User(__no_default__=True, **data)
+    user._dirty.clear()
+    return user
+
+async def save_user(user: User, *usernames: str):
+    """Write a user's changed columns and drop their cached rows.
+
+    ``usernames`` names further cache entries to drop, such as the old
+    username after a rename.
+    """
+    try:
+        await run_db(user.save)
+    finally:
+        for username in {user.username, *usernames}:
+            user_cache.invalidate(username)
+
 @router.post("/register", response_model=UserResponse)
 async def register_user(user_data: UserCreate):
-    if User.select().where(User.username == user_data.username).exists():
+    if await run_db(User.select().where(User.username == user_data.username).exists):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
-    if User.select().where(User.email == user_data.email).exists():
+    if await run_db(User.select().where(User.email == user_data.email).exists):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
-    hashed_password = get_password_hash(user_data.password)
-    user = User.create(
+    hashed_password = await password_hasher.hash(user_data.password)
+    user = await run_db(
+        User.create,
         username=user_data.username,
         email=user_data.email,
         password_hash=hashed_password
@@ -45,7 +82,7 @@ async def register_user(user_data: UserCreate):
 @router.post("/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        user = User.get(User.username == form_data.username)
+        user = await run_db(User.get, User.username == form_data.username)
     except User.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,7 +90,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not verify_password(form_data.password, user.password_hash):
+    if not await password_hasher.verify(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -65,15 +102,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     )
     
     user.last_login = datetime.now()
-    user.save()
+    await save_user(user)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    return await user_from_token(token)
+
+async def user_from_token(token: str) -> User:
+    """Resolve a bearer token to its user, from the cache when possible."""
     payload = verify_token(token)
     username: str = payload.get("sub")
+    user = get_cached_user(username)
+    if user is not None:
+        return user
     try:
-        user = User.get(User.username == username)
+        user = await run_db(User.get, User.username == username)
+        cache_user(user)
         return user
     except User.DoesNotExist:
         raise HTTPException(
@@ -83,16 +128,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         )
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_user)):
-    return current_user
+async def read_users_me(
+    fields: Tuple[str, ...] = Depends(requested_fields(UserResponse)),
+    current_user: User = Depends(get_current_user)
+):
+    # The row is already loaded to authenticate, so only the payload narrows
+    return ORJSONResponse(current_user.to_dict(fields))
 
 @router.put("/me", response_model=UserResponse)
 async def update_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user)
 ):
+    old_username = current_user.username
+
     if user_update.username and user_update.username != current_user.username:
-        if User.select().where(User.username == user_update.username).exists():
+        if await run_db(User.select().where(User.username == user_update.username).exists):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
@@ -100,7 +151,7 @@ async def update_user(
         current_user.username = user_update.username
 
     if user_update.email and user_update.email != current_user.email:
-        if User.select().where(User.email == user_update.email).exists():
+        if await run_db(User.select().where(User.email == user_update.email).exists):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
@@ -115,7 +166,10 @@ async def update_user(
         current_user.longitude = user_update.longitude
         current_user.last_location_update = datetime.now()
 
-    current_user.save()
+    await save_user(current_user, old_username)
+    if current_user.username != old_username:
+        # The ad feeds show each author's username
+        await run_db(TableVersion.bump, PersonalAd._meta.table_name)
     return current_user
 
 @router.post("/me/location")
@@ -127,5 +181,5 @@ async def update_location(
     current_user.latitude = latitude
     current_user.longitude = longitude
     current_user.last_location_update = datetime.now()
-    current_user.save()
+    await save_user(current_user)
     return {"message": "Location updated successfully"}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -42,6 +42,8 @@ class PersonalAdResponse(PersonalAdBase):
     created_at: datetime
     updated_at: datetime
     is_active: bool
+    distance: Optional[float] = None  # Miles from the requesting user
+    username: Optional[str] = None  # Author's username, on list endpoints
 
 class MessageBase(BaseModel):
     content: str
@@ -49,6 +51,15 @@ class MessageBase(BaseModel):
 class MessageCreate(MessageBase):
     receiver_id: int
 
+class MessageSendFrame(MessageCreate):
+    """Message sent as a JSON frame over the WebSocket."""
+    type: Literal["send_message"]
+    client_id: str = Field(max_length=64)  # Echoed back in the ack
+
+class MessagesRead(BaseModel):
+    other_user_id: int
+    up_to_id: int
+
 class MessageResponse(MessageBase):
     id: int
     sender_id: int
@@ -57,6 +68,20 @@ class MessageResponse(MessageBase):
     is_read: bool
     read_at: Optional[datetime] = None
 
+class PublicUserResponse(BaseModel):
+    id: int
+    username: str
+    profile_picture: Optional[str] = None
+
+class ConversationResponse(BaseModel):
+    user: PublicUserResponse
+    last_message: MessageResponse
+    unread_count: int
+
+class UnreadCountResponse(BaseModel):
+    sender_id: int
+    unread_count: int
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,20 @@
+"""Add personal ad location index
+
+Peewee-migrate migration file
+
+"""
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    # Composite index backing the bounding-box prefilter of the ad feed
+    migrator.sql('''
+        CREATE INDEX IF NOT EXISTS idx_personalad_active_location
+        ON personalad (is_active, latitude, longitude)
+    ''')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    migrator.sql('DROP INDEX IF EXISTS idx_personalad_active_location')
@@ -0,0 +1,30 @@
+"""Add geohash proximity keys
+
+Peewee-migrate migration file
+
+"""
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    # Precomputed geohash of each row's coordinates. Existing rows are
+    # populated with: python migrations/manage.py backfill-geohash, which
+    # scripts/start.sh runs after the migrations
+    migrator.sql('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS geohash VARCHAR(12)')
+    migrator.sql('ALTER TABLE personalad ADD COLUMN IF NOT EXISTS geohash VARCHAR(12)')
+
+    # Create indexes
+    migrator.sql('CREATE INDEX IF NOT EXISTS idx_user_geohash ON "user" (geohash)')
+    migrator.sql('''
+        CREATE INDEX IF NOT EXISTS idx_personalad_active_geohash
+        ON personalad (is_active, geohash)
+    ''')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    migrator.sql('DROP INDEX IF EXISTS idx_personalad_active_geohash')
+    migrator.sql('DROP INDEX IF EXISTS idx_user_geohash')
+    migrator.sql('ALTER TABLE personalad DROP COLUMN IF EXISTS geohash')
+    migrator.sql('ALTER TABLE "user" DROP COLUMN IF EXISTS geohash')
@@ -0,0 +1,25 @@
+"""Add personal ad feed index
+
+Peewee-migrate migration file
+
+"""
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    # Composite index backing keyset pagination of the newest-first feed
+    migrator.sql('''
+        CREATE INDEX IF NOT EXISTS idx_personalad_active_created
+        ON personalad (is_active, created_at DESC, id DESC)
+    ''')
+    migrator.sql('''
+        CREATE INDEX IF NOT EXISTS idx_personalad_user_created
+        ON personalad (user_id, created_at DESC, id DESC)
+    ''')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    migrator.sql('DROP INDEX IF EXISTS idx_personalad_user_created')
+    migrator.sql('DROP INDEX IF EXISTS idx_personalad_active_created')
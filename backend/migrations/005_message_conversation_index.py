@@ -0,0 +1,21 @@
+"""Add message conversation index
+
+Peewee-migrate migration file
+
+"""
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    # Composite index backing keyset pagination of a conversation. Both
+    # directions of a user pair are served by the same index.
+    migrator.sql('''
+        CREATE INDEX IF NOT EXISTS idx_message_sender_receiver
+        ON message (sender_id, receiver_id, id)
+    ''')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    migrator.sql('DROP INDEX IF EXISTS idx_message_sender_receiver')
@@ -0,0 +1,36 @@
+"""Add unread message counters
+
+Peewee-migrate migration file
+
+"""
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    # Per-conversation unread counters, kept in step with message.is_read
+    migrator.sql('''
+        CREATE TABLE IF NOT EXISTS unreadcount (
+            receiver_id INTEGER NOT NULL,
+            sender_id INTEGER NOT NULL,
+            unread INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (receiver_id, sender_id),
+            FOREIGN KEY (receiver_id) REFERENCES "user" (id) ON DELETE CASCADE,
+            FOREIGN KEY (sender_id) REFERENCES "user" (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Seed the counters from the messages that are already unread
+    migrator.sql('''
+        INSERT INTO unreadcount (receiver_id, sender_id, unread)
+        SELECT receiver_id, sender_id, COUNT(*)
+        FROM message
+        WHERE NOT is_read
+        GROUP BY receiver_id, sender_id
+        ON CONFLICT (receiver_id, sender_id) DO UPDATE SET unread = EXCLUDED.unread
+    ''')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    migrator.sql('DROP TABLE IF EXISTS unreadcount CASCADE')
@@ -0,0 +1,22 @@
+"""Add table change counters
+
+Peewee-migrate migration file
+
+"""
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    # Change counters tagging cached responses, bumped by the write paths
+    migrator.sql('''
+        CREATE TABLE IF NOT EXISTS tableversion (
+            name VARCHAR(255) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    migrator.sql('DROP TABLE IF EXISTS tableversion CASCADE')
@@ -0,0 +1,36 @@
+"""Drop duplicate indexes
+
+Peewee-migrate migration file
+
+"""
+
+# Unnamed copies of the migrations' indexes that create_tables(safe=True)
+# added at startup before the models named their indexes
+DUPLICATE_INDEXES = (
+    'user_username',
+    'user_email',
+    'user_geohash',
+    'personalad_user_id',
+    'personalad_is_active',
+    'personalad_is_active_latitude_longitude',
+    'personalad_is_active_geohash',
+    'personalad_is_active_created_at_id',
+    'personalad_user_id_created_at_id',
+    'message_sender_id',
+    'message_receiver_id',
+    'message_is_read',
+    'message_sender_id_receiver_id_id',
+)
+
+def migrate(migrator, database, fake=False, **kwargs):
+    """Write your migrations here."""
+    
+    for name in DUPLICATE_INDEXES:
+        migrator.sql(f'DROP INDEX IF EXISTS {name}')
+
+
+def rollback(migrator, database, fake=False, **kwargs):
+    """Write your rollback migrations here."""
+    
+    # The dropped indexes duplicated ones that remain; nothing to restore
+    pass
@@ -5,6 +5,11 @@ from peewee_migrate import Router
 from peewee import PostgresqlDatabase
 import logging
 
+# Make the application package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.geo import location_geohash
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -60,9 +65,43 @@ def rollback(steps=1):
         if not db.is_closed():
             db.close()
 
+def backfill_geohash(batch_size=1000):
+    """Populate the geohash column of rows created before it existed."""
+    try:
+        # Ensure we're connected
+        if db.is_closed():
+            db.connect()
+
+        for table in ('"user"', 'personalad'):
+            total = 0
+            while True:
+                rows = db.execute_sql(
+                    f'SELECT id, latitude, longitude FROM {table} '
+                    'WHERE geohash IS NULL AND latitude IS NOT NULL '
+                    'AND longitude IS NOT NULL LIMIT %s',
+                    (batch_size,)
+                ).fetchall()
+                if not rows:
+                    break
+
+                with db.atomic():
+                    for row_id, latitude, longitude in rows:
+                        db.execute_sql(
+                            f'UPDATE {table} SET geohash = %s WHERE id = %s',
+                            (location_geohash(latitude, longitude), row_id)
+                        )
+                total += len(rows)
+            logger.info(f"Backfilled geohash for {total} row(s) in {table}")
+    except Exception as e:
+        logger.error(f"Failed to backfill geohash: {e}")
+        raise
+    finally:
+        if not db.is_closed():
+            db.close()
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python manage.py [run|rollback <steps>]")
+        print("Usage: python manage.py [run|rollback <steps>|backfill-geohash]")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -77,9 +116,11 @@ if __name__ == "__main__":
             except ValueError:
                 print("Steps must be a number")
                 sys.exit(1)
+        elif command == "backfill-geohash":
+            backfill_geohash()
         else:
             print("Invalid command")
-            print("Usage: python manage.py [run|rollback <steps>]")
+            print("Usage: python manage.py [run|rollback <steps>|backfill-geohash]")
             sys.exit(1)
     except Exception as e:
         logger.error(f"Command failed: {e}")
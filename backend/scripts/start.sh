@@ -14,6 +14,8 @@ wait_for_postgres() {
 run_migrations() {
     echo "Running database migrations..."
     python migrations/manage.py run
+    # Fills only rows still missing their geohash, so later starts are cheap
+    python migrations/manage.py backfill-geohash
 }
 
 # Main execution
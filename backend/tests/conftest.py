@@ -4,12 +4,16 @@ from peewee import SqliteDatabase
 from contextlib import contextmanager
 
 from app.main import app
-from app.models.user import User, PersonalAd, Message
-from app.database import db, database_state_default, database_state, PeeweeConnectionState
+from app.core.security import get_password_hash
+from app.routers.user import user_cache
+from app.models.user import User, PersonalAd, Message, UnreadCount, TableVersion
+from app.database import reset_db_state
 
 # Use SQLite for testing
-test_db = SqliteDatabase(':memory:')
-MODELS = [User, PersonalAd, Message]
+# A single shared connection, so requests served on the TestClient's thread
+# see the same in-memory database as the fixtures
+test_db = SqliteDatabase(':memory:', thread_safe=False, check_same_thread=False)
+MODELS = [User, PersonalAd, Message, UnreadCount, TableVersion]
 
 @pytest.fixture(autouse=True)
 def setup_test_db():
@@ -19,8 +23,8 @@ def setup_test_db():
     test_db.create_tables(MODELS)
 
     # Setup test state and yield for tests
-    state = PeeweeConnectionState()
-    database_state.set(state)
+    reset_db_state()
+    user_cache.clear()
     
     yield
     
@@ -37,7 +41,7 @@ def test_user():
     user = User.create(
         username="testuser",
         email="test@example.com",
-        password_hash="$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LHHWsDzZ7GZm3nFm2"  # password: testpass
+        password_hash=get_password_hash("testpass")
     )
     return user
 
@@ -59,3 +63,29 @@ def authorized_client(client, test_user_token):
         "Authorization": f"Bearer {test_user_token}"
     }
     return client
+
+@pytest.fixture
+def another_user(client):
+    response = client.post(
+        "/users/register",
+        json={
+            "username": "anotheruser",
+            "email": "another@example.com",
+            "password": "testpass123"
+        }
+    )
+    return response.json()
+
+@pytest.fixture
+def another_client(authorized_client, another_user):
+    """A second client, logged in as ``another_user``."""
+    client = TestClient(authorized_client.app)
+    token = client.post(
+        "/users/token",
+        data={
+            "username": "anotheruser",
+            "password": "testpass123"
+        }
+    ).json()["access_token"]
+    client.headers = {"Authorization": f"Bearer {token}"}
+    return client
@@ -0,0 +1,56 @@
+import asyncio
+
+from app.core.batching import WriteBatcher
+
+def test_concurrent_submits_are_flushed_together():
+    flushed = []
+
+    def flush(items):
+        flushed.append(list(items))
+        return [item * 10 for item in items]
+
+    async def scenario():
+        batcher = WriteBatcher(flush, max_batch_size=3, window_seconds=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert results == [0, 10, 20, 30, 40]
+    # A full batch is written straight away, the rest after the window
+    assert flushed == [[0, 1, 2], [3, 4]]
+    stats = batcher.stats()
+    assert stats["batches"] == 2
+    assert stats["items"] == 5
+    assert stats["max_batch"] == 3
+
+def test_failed_flush_fails_every_submitter():
+    def flush(items):
+        raise RuntimeError("database unavailable")
+
+    async def scenario():
+        batcher = WriteBatcher(flush, max_batch_size=10, window_seconds=0.001)
+        return batcher, await asyncio.gather(
+            batcher.submit(1), batcher.submit(2), return_exceptions=True
+        )
+
+    batcher, results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats()["failures"] == 1
+
+def test_drain_writes_pending_items():
+    flushed = []
+
+    def flush(items):
+        flushed.append(list(items))
+        return items
+
+    async def scenario():
+        batcher = WriteBatcher(flush, max_batch_size=10, window_seconds=60)
+        submitted = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0)
+        # The window is far off; draining writes the item anyway
+        await batcher.drain()
+        return await submitted
+
+    assert asyncio.run(scenario()) == 1
+    assert flushed == [[1]]
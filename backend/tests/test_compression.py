@@ -0,0 +1,60 @@
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.testclient import TestClient
+
+from app.core import compression
+from app.core.compression import CompressionMiddleware, CompressionStats, choose_encoding
+
+def make_client(stats=None):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100, stats=stats)
+
+    @app.get("/large")
+    def large():
+        return ORJSONResponse([{"content": "hello"}] * 100)
+
+    @app.get("/small")
+    def small():
+        return ORJSONResponse({"ok": True})
+
+    @app.get("/image")
+    def image():
+        return Response(b"\x89PNG" * 100, media_type="image/png")
+
+    return TestClient(app)
+
+def test_choose_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("br, gzip") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("") is None
+
+    monkeypatch.setattr(compression, "brotli", object())
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip;q=1.0, br;q=0.5") == "gzip"
+
+def test_large_json_is_gzipped():
+    stats = CompressionStats()
+    client = make_client(stats)
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == [{"content": "hello"}] * 100
+
+    data = stats.as_dict()
+    assert data["responses"] == {"gzip": 1}
+    assert data["bytes_out"] < data["bytes_in"]
+    assert data["bytes_out"] == int(response.headers["content-length"])
+
+def test_small_and_binary_responses_pass_through():
+    client = make_client()
+    for path in ("/small", "/image"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
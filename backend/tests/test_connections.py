@@ -0,0 +1,185 @@
+import asyncio
+import pytest
+
+import json
+
+from app.core.connections import IDLE_CLOSE_CODE, SLOW_CONSUMER_CLOSE_CODE, ConnectionManager
+from app.core.events import Event
+
+class FakeWebSocket:
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.accepted = False
+        self.closed_with = None
+        self.blocked = blocked
+
+    async def accept(self, subprotocol=None):
+        self.accepted = True
+
+    async def send_text(self, message):
+        if self.blocked:
+            await asyncio.Event().wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def test_every_connection_of_a_user_receives_messages():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10)
+        phone, laptop = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(phone, 1)
+        await manager.connect(laptop, 1)
+
+        manager.send_personal_message(Event("greeting", {"text": "hello"}), 1)
+        await asyncio.sleep(0)
+        return manager, phone, laptop
+
+    manager, phone, laptop = asyncio.run(scenario())
+    expected = {"type": "greeting", "data": {"text": "hello"}}
+    assert [json.loads(frame) for frame in phone.sent] == [expected]
+    assert [json.loads(frame) for frame in laptop.sent] == [expected]
+    assert manager.stats()["connections"] == 2
+
+def test_slow_consumer_is_disconnected():
+    async def scenario():
+        manager = ConnectionManager(queue_size=2)
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        await manager.connect(slow, 1)
+        await manager.connect(fast, 1)
+
+        # The slow client's writer holds one message, its queue two more
+        for i in range(4):
+            manager.send_personal_message(Event("greeting", {"n": i}), 1)
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return manager, slow, fast
+
+    manager, slow, fast = asyncio.run(scenario())
+    assert slow.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert [json.loads(frame)["data"]["n"] for frame in fast.sent] == [0, 1, 2, 3]
+    stats = manager.stats()
+    assert stats["connections"] == 1
+    assert stats["slow_disconnects"] == 1
+
+def test_disconnect_removes_user_without_connections():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10)
+        connection = await manager.connect(FakeWebSocket(), 1)
+        manager.disconnect(connection)
+        manager.send_personal_message(Event("greeting", {}), 1)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.active_connections == {}
+
+def test_queued_events_are_coalesced():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, max_coalesce=3)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, 1)
+
+        # Queued before the writer runs, so they go out together
+        for i in range(4):
+            manager.send_personal_message(Event("greeting", {"n": i}), 1)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return manager, websocket
+
+    manager, websocket = asyncio.run(scenario())
+    frames = [json.loads(frame) for frame in websocket.sent]
+    assert [event["data"]["n"] for event in frames[0]] == [0, 1, 2]
+    assert frames[1]["data"]["n"] == 3
+    stats = manager.stats()
+    assert stats["frames_sent"] == 2
+    assert stats["events_sent"] == 4
+
+def test_msgpack_frames_coalesce():
+    msgpack = pytest.importorskip("msgpack")
+    from app.core.events import CODECS
+
+    frame = CODECS["msgpack"].frame([Event("a", {"n": 1}), Event("b", {"n": 2})])
+    assert msgpack.unpackb(frame) == [
+        {"type": "a", "data": {"n": 1}},
+        {"type": "b", "data": {"n": 2}},
+    ]
+
+def test_incomplete_codec_cannot_be_created():
+    from app.core.events import Codec
+
+    class TextOnlyCodec(Codec):
+        name = "text"
+
+        def dumps(self, payload):
+            return str(payload).encode()
+
+    with pytest.raises(TypeError):
+        TextOnlyCodec()
+
+def test_sweep_pings_quiet_sockets_and_evicts_silent_ones():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, heartbeat_interval=30, idle_timeout=90)
+        quiet, silent = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(quiet, 1)
+        silent_connection = await manager.connect(silent, 2)
+        for connection in manager.active_connections[1]:
+            connection.last_seen -= 45
+        silent_connection.last_seen -= 120
+
+        manager.sweep()
+        await asyncio.sleep(0)
+        return manager, quiet, silent
+
+    manager, quiet, silent = asyncio.run(scenario())
+    assert [json.loads(frame)["type"] for frame in quiet.sent] == ["ping"]
+    assert silent.closed_with == IDLE_CLOSE_CODE
+    stats = manager.stats()
+    assert stats["connections"] == 1
+    assert stats["idle_evictions"] == 1
+
+def test_connections_over_capacity_are_rejected():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, max_connections=1)
+        await manager.connect(FakeWebSocket(), 1)
+        assert manager.at_capacity()
+        turned_away = FakeWebSocket()
+        await manager.reject(turned_away)
+        return manager, turned_away
+
+    manager, turned_away = asyncio.run(scenario())
+    # Accepted first, so the client sees the close code rather than a 403
+    assert turned_away.accepted
+    assert turned_away.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert manager.stats()["rejected"] == 1
+    assert manager.stats()["peak_connections"] == 1
+
+def test_reserved_slots_count_towards_capacity():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, max_connections=2)
+        first, second = manager.reserve(), manager.reserve()
+        # Both handshakes are still in flight, yet a third is turned away
+        third = manager.reserve()
+        await manager.connect(FakeWebSocket(), 1, reserved=True)
+        manager.release()
+        return manager, (first, second, third)
+
+    manager, reserved = asyncio.run(scenario())
+    assert reserved == (True, True, False)
+    stats = manager.stats()
+    assert stats["connections"] == 1
+    assert stats["reserved"] == 0
+    assert manager.reserve()
+
+def test_handshakes_beyond_the_limit_wait_then_time_out():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, handshake_concurrency=1, handshake_timeout=0.01)
+        async with manager.admission() as first:
+            async with manager.admission() as second:
+                pass
+        async with manager.admission() as after_release:
+            pass
+        return manager, first, second, after_release
+
+    manager, first, second, after_release = asyncio.run(scenario())
+    assert (first, second, after_release) == (True, False, True)
+    assert manager.stats()["handshake_timeouts"] == 1
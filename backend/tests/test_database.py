@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import pytest
+from fastapi import status
+
+from app.database import PoolStats, database_state, reset_db_state, run_db
+
+def test_pool_stats_records_checkouts():
+    stats = PoolStats()
+    stats.record_checkout(0.002)
+    stats.record_checkout(0.004)
+    stats.record("timeouts")
+
+    data = stats.as_dict()
+    assert data["checkouts"] == 2
+    assert data["timeouts"] == 1
+    assert data["avg_wait_ms"] == pytest.approx(3.0)
+    assert data["max_wait_ms"] == pytest.approx(4.0)
+    assert data["checkouts_per_second"] > 0
+
+def test_metrics_reports_pool_stats(client):
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    pool = response.json()["database_pool"]
+    assert pool["max_connections"] > 0
+    assert "in_use" in pool
+    assert "checkouts_per_second" in pool
+
+def test_run_db_shares_request_connection_state():
+    async def borrow():
+        reset_db_state()
+        database_state.get()["conn"] = connection = object()
+        seen = await run_db(lambda: (database_state.get()["conn"], threading.get_ident()))
+        return connection, seen
+
+    connection, (seen_connection, thread_id) = asyncio.run(borrow())
+    assert seen_connection is connection
+    assert thread_id != threading.get_ident()
+
+def test_fresh_request_state_is_closed():
+    from app.database import db
+
+    async def check():
+        reset_db_state()
+        return db.is_closed(), db.in_transaction()
+
+    assert asyncio.run(check()) == (True, False)
+
+def test_to_dict_reads_foreign_keys_without_fetching(test_user, monkeypatch):
+    from app.models.user import Message, User
+
+    receiver = User.create(username="other", email="other@example.com", password_hash="x")
+    Message.create(sender=test_user, receiver=receiver, content="hi", read_at=None)
+    message = Message.get()
+
+    def no_queries(*args, **kwargs):
+        raise AssertionError("to_dict ran a query")
+
+    monkeypatch.setattr(Message._meta.database, "execute_sql", no_queries)
+    data = message.to_dict()
+    monkeypatch.undo()
+
+    assert data["sender"] == test_user.id
+    assert data["receiver"] == receiver.id
+    assert data["created_at"] == message.created_at.isoformat()
+    assert data["read_at"] is None
+
+def test_to_dicts_converts_result_sets(test_user):
+    from app.models.user import User
+
+    rows = User.select().dicts()
+    data = User.to_dicts(rows, fields=["id", "username", "created_at"])
+    assert data == [{
+        "id": test_user.id,
+        "username": "testuser",
+        "created_at": User.get_by_id(test_user.id).created_at.isoformat(),
+    }]
+    assert User.to_dicts(User.select(), fields=["id", "username", "created_at"]) == data
+
+def test_serializer_is_built_once_per_field_set():
+    from app.models.user import User
+
+    assert User.serializer(["id", "username"]) is User.serializer(("id", "username"))
+    assert User.serializer() is not User.serializer(["id"])
+    with pytest.raises(ValueError):
+        User.serializer(["id", "nickname"])
+
+def test_contexts_without_state_do_not_share_one():
+    from contextvars import Context
+    from app.database import db
+
+    def state():
+        db.is_closed()
+        return database_state.get()
+
+    first, second = Context().run(state), Context().run(state)
+    assert first is not None and second is not None
+    assert first is not second
+
+def test_close_all_forgets_returned_connections():
+    from app.database import db
+
+    db._returned_at[123] = 0.0
+    db.close_all()
+    assert db._returned_at == {}
+
+class FakeDatabase:
+    def __init__(self, closed=True):
+        self.closed = closed
+
+    def is_closed(self):
+        return self.closed
+
+    def connect(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_run_db_returns_borrowed_connections(monkeypatch):
+    from app import database
+
+    borrowing = FakeDatabase()
+    monkeypatch.setattr(database, "db", borrowing)
+    asyncio.run(run_db(borrowing.connect))
+    assert borrowing.is_closed()
+
+    # A connection the caller opened itself is left open
+    holding = FakeDatabase(closed=False)
+    monkeypatch.setattr(database, "db", holding)
+    asyncio.run(run_db(lambda: None))
+    assert not holding.is_closed()
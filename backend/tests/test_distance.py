@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+from app.core.distance import haversine_miles, nearest_within
+
+def test_haversine_matches_geodesic_within_tolerance():
+    origin = (40.7128, -74.0060)
+    points = [(41.4128, -74.0060), (34.0522, -118.2437), (51.5074, -0.1278)]
+    distances = haversine_miles(
+        origin[0],
+        origin[1],
+        [lat for lat, _ in points],
+        [lon for _, lon in points]
+    )
+    for point, distance in zip(points, distances):
+        assert distance == pytest.approx(geodesic(origin, point).miles, rel=0.005)
+
+def test_nearest_within_filters_and_sorts():
+    distances = np.array([30.0, 5.0, 80.0, 12.0])
+    assert list(nearest_within(distances, 40)) == [1, 3, 0]
+    assert list(nearest_within(distances)) == [1, 3, 0, 2]
@@ -0,0 +1,43 @@
+from geopy.distance import geodesic
+
+from app.core.geo import bounding_box, encode_geohash, geohash_cells
+
+def test_bounding_box_contains_radius():
+    min_lat, max_lat, lon_ranges = bounding_box(40.7128, -74.0060, 50)
+    assert len(lon_ranges) == 1
+    min_lon, max_lon = lon_ranges[0]
+
+    # Points exactly 50 miles north, south, east and west are inside the box
+    for bearing in (0, 90, 180, 270):
+        point = geodesic(miles=50).destination((40.7128, -74.0060), bearing)
+        assert min_lat <= point.latitude <= max_lat
+        assert min_lon <= point.longitude <= max_lon
+
+def test_bounding_box_splits_at_antimeridian():
+    min_lat, max_lat, lon_ranges = bounding_box(0.0, 179.9, 50)
+    assert len(lon_ranges) == 2
+    assert lon_ranges[0][1] == 180.0
+    assert lon_ranges[1][0] == -180.0
+
+def test_bounding_box_near_pole_spans_all_longitudes():
+    min_lat, max_lat, lon_ranges = bounding_box(89.9, 10.0, 50)
+    assert max_lat == 90.0
+    assert lon_ranges == [(-180.0, 180.0)]
+
+def test_encode_geohash_known_value():
+    assert encode_geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+def test_geohash_cells_cover_radius():
+    cells = geohash_cells(40.7128, -74.0060, 50)
+    assert 1 <= len(cells) <= 9
+
+    for bearing in range(0, 360, 45):
+        point = geodesic(miles=50).destination((40.7128, -74.0060), bearing)
+        geohash = encode_geohash(point.latitude, point.longitude)
+        assert any(geohash.startswith(cell) for cell in cells)
+
+def test_geohash_cells_wrap_antimeridian():
+    cells = geohash_cells(0.0, 179.99, 10)
+    point = geodesic(miles=10).destination((0.0, 179.99), 90)
+    geohash = encode_geohash(point.latitude, point.longitude)
+    assert any(geohash.startswith(cell) for cell in cells)
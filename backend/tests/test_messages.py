@@ -1,7 +1,6 @@
 import pytest
-from fastapi import status
+from fastapi import WebSocketDisconnect, status
 import json
-from fastapi.testclient import TestClient
 
 @pytest.fixture
 def test_message():
@@ -9,18 +8,6 @@ def test_message():
         "content": "Test message content"
     }
 
-@pytest.fixture
-def another_user(client):
-    response = client.post(
-        "/users/register",
-        json={
-            "username": "anotheruser",
-            "email": "another@example.com",
-            "password": "testpass123"
-        }
-    )
-    return response.json()
-
 def test_send_message(authorized_client, test_user, another_user, test_message):
     message_data = {
         **test_message,
@@ -61,18 +48,8 @@ def test_get_messages(authorized_client, test_user, another_user, test_message):
     assert data[0]["sender_id"] == test_user.id
     assert data[0]["receiver_id"] == another_user["id"]
 
-def test_mark_message_as_read(authorized_client, test_user, another_user, test_message):
+def test_mark_message_as_read(authorized_client, test_user, another_user, another_client, test_message):
     # Create a message from another user to test user
-    another_client = TestClient(authorized_client.app)
-    another_token = another_client.post(
-        "/users/token",
-        data={
-            "username": "anotheruser",
-            "password": "testpass123"
-        }
-    ).json()["access_token"]
-    another_client.headers = {"Authorization": f"Bearer {another_token}"}
-
     message_data = {
         **test_message,
         "receiver_id": test_user.id
@@ -91,18 +68,8 @@ def test_mark_message_as_read(authorized_client, test_user, another_user, test_m
     assert message["is_read"] == True
     assert message["read_at"] is not None
 
-def test_get_unread_messages(authorized_client, test_user, another_user, test_message):
+def test_get_unread_messages(authorized_client, test_user, another_user, another_client, test_message):
     # Create messages from another user to test user
-    another_client = TestClient(authorized_client.app)
-    another_token = another_client.post(
-        "/users/token",
-        data={
-            "username": "anotheruser",
-            "password": "testpass123"
-        }
-    ).json()["access_token"]
-    another_client.headers = {"Authorization": f"Bearer {another_token}"}
-
     # Send multiple messages
     message_data = {
         **test_message,
@@ -119,14 +86,250 @@ def test_get_unread_messages(authorized_client, test_user, another_user, test_me
     assert all(not message["is_read"] for message in data)
     assert all(message["receiver_id"] == test_user.id for message in data)
 
-def test_websocket_connection(client, test_user_token):
+def test_websocket_send_message(client, authorized_client, test_user_token, another_user):
     with client.websocket_connect(f"/messages/ws/{test_user_token}") as websocket:
         # Test sending a message through WebSocket
-        websocket.send_text("Hello WebSocket!")
-        data = websocket.receive_text()
-        assert "You wrote: Hello WebSocket!" in data
+        websocket.send_text(json.dumps({
+            "type": "send_message",
+            "client_id": "local-1",
+            "receiver_id": another_user["id"],
+            "content": "Hello WebSocket!"
+        }))
+        ack = json.loads(websocket.receive_text())
+        assert ack["type"] == "ack"
+        ack = ack["data"]
+        assert ack["client_id"] == "local-1"
+        assert ack["created_at"]
+
+    messages = authorized_client.get("/messages/", params={"other_user_id": another_user["id"]}).json()
+    assert [(m["id"], m["content"]) for m in messages] == [(ack["id"], "Hello WebSocket!")]
+
+def test_websocket_send_message_errors(client, test_user_token):
+    with client.websocket_connect(f"/messages/ws/{test_user_token}") as websocket:
+        websocket.send_text("not json")
+        assert json.loads(websocket.receive_text()) == {"type": "error", "data": {"detail": "Invalid frame"}}
+
+        websocket.send_text(json.dumps({
+            "type": "send_message",
+            "client_id": "local-2",
+            "receiver_id": 99999,
+            "content": "Anyone there?"
+        }))
+        error = json.loads(websocket.receive_text())["data"]
+        assert error["client_id"] == "local-2"
+        assert error["detail"] == "Receiver not found"
+
+def test_websocket_failed_write_keeps_socket(client, test_user_token, another_user, monkeypatch):
+    from app.routers import messages
+
+    async def failing_submit(item):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(messages.message_batcher, "submit", failing_submit)
+    with client.websocket_connect(f"/messages/ws/{test_user_token}") as websocket:
+        websocket.send_text(json.dumps({
+            "type": "send_message",
+            "client_id": "local-3",
+            "receiver_id": another_user["id"],
+            "content": "Hello"
+        }))
+        error = json.loads(websocket.receive_text())["data"]
+        assert error == {"client_id": "local-3", "detail": "Message could not be sent"}
+
+        # Still connected
+        websocket.send_text("not json")
+        assert json.loads(websocket.receive_text())["data"]["detail"] == "Invalid frame"
+
+def test_websocket_msgpack_subprotocol(client, test_user_token, another_user):
+    msgpack = pytest.importorskip("msgpack")
+    with client.websocket_connect(
+        f"/messages/ws/{test_user_token}",
+        subprotocols=["msgpack"]
+    ) as websocket:
+        assert websocket.accepted_subprotocol == "msgpack"
+        websocket.send_bytes(msgpack.packb({
+            "type": "send_message",
+            "client_id": "local-3",
+            "receiver_id": another_user["id"],
+            "content": "Binary hello"
+        }))
+        ack = msgpack.unpackb(websocket.receive_bytes())
+        assert ack["type"] == "ack"
+        assert ack["data"]["client_id"] == "local-3"
+
+def test_websocket_pong_is_accepted_silently(client, test_user_token, another_user):
+    with client.websocket_connect(f"/messages/ws/{test_user_token}") as websocket:
+        websocket.send_text(json.dumps({"type": "pong"}))
+        websocket.send_text(json.dumps({
+            "type": "send_message",
+            "client_id": "after-pong",
+            "receiver_id": another_user["id"],
+            "content": "Still here"
+        }))
+        # The first frame back is the ack, not an error about the pong
+        assert json.loads(websocket.receive_text())["type"] == "ack"
 
 def test_websocket_invalid_token(client):
-    with pytest.raises(Exception):
-        with client.websocket_connect("/messages/ws/invalid-token") as websocket:
-            pass
+    with client.websocket_connect("/messages/ws/invalid-token") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+    assert closed.value.code == status.WS_1008_POLICY_VIOLATION
+
+def test_get_conversations(authorized_client, test_user, another_user, another_client, test_message):
+    third_user = authorized_client.post(
+        "/users/register",
+        json={
+            "username": "thirduser",
+            "email": "third@example.com",
+            "password": "testpass123"
+        }
+    ).json()
+    authorized_client.post("/messages/", json={**test_message, "receiver_id": another_user["id"]})
+    another_client.post("/messages/", json={"content": "First reply", "receiver_id": test_user.id})
+    another_client.post("/messages/", json={"content": "Second reply", "receiver_id": test_user.id})
+    authorized_client.post("/messages/", json={"content": "Hi third", "receiver_id": third_user["id"]})
+
+    response = authorized_client.get("/messages/conversations")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [c["user"]["id"] for c in data] == [third_user["id"], another_user["id"]]
+    assert "email" not in data[0]["user"]
+    assert data[0]["last_message"]["content"] == "Hi third"
+    assert data[0]["unread_count"] == 0
+    assert data[1]["user"]["username"] == "anotheruser"
+    assert data[1]["last_message"]["content"] == "Second reply"
+    assert data[1]["unread_count"] == 2
+
+def test_get_conversations_paginated(authorized_client, test_user, test_message):
+    partners = []
+    for i in range(3):
+        partner = authorized_client.post(
+            "/users/register",
+            json={
+                "username": f"partner{i}",
+                "email": f"partner{i}@example.com",
+                "password": "testpass123"
+            }
+        ).json()
+        authorized_client.post("/messages/", json={**test_message, "receiver_id": partner["id"]})
+        partners.append(partner["id"])
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = authorized_client.get("/messages/conversations", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        seen.extend(c["user"]["id"] for c in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == partners[::-1]
+
+def test_get_messages_paginated(authorized_client, test_user, another_user):
+    for i in range(5):
+        authorized_client.post("/messages/", json={"content": f"Message {i}", "receiver_id": another_user["id"]})
+
+    response = authorized_client.get(
+        "/messages/",
+        params={"other_user_id": another_user["id"], "limit": 3}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    latest = response.json()
+    assert [m["content"] for m in latest] == ["Message 2", "Message 3", "Message 4"]
+
+    response = authorized_client.get(
+        "/messages/",
+        params={"other_user_id": another_user["id"], "limit": 3, "before_id": latest[0]["id"]}
+    )
+    assert [m["content"] for m in response.json()] == ["Message 0", "Message 1"]
+
+def test_get_messages_sparse_fields(authorized_client, test_user, another_user):
+    authorized_client.post("/messages/", json={"content": "Hi", "receiver_id": another_user["id"]})
+
+    response = authorized_client.get(
+        "/messages/",
+        params={"other_user_id": another_user["id"], "fields": "content,id"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"id": 1, "content": "Hi"}]
+
+    response = authorized_client.get(
+        "/messages/",
+        params={"other_user_id": another_user["id"], "fields": "content,password"}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Unknown fields: password"
+
+def test_mark_conversation_as_read(authorized_client, test_user, another_user, another_client, test_message):
+    message_data = {
+        **test_message,
+        "receiver_id": test_user.id
+    }
+    ids = [another_client.post("/messages/", json=message_data).json()["id"] for _ in range(3)]
+
+    response = authorized_client.put(
+        "/messages/read",
+        json={"other_user_id": another_user["id"], "up_to_id": ids[1]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["updated"] == 2
+
+    unread = authorized_client.get("/messages/unread").json()
+    assert [m["id"] for m in unread] == [ids[2]]
+
+def test_get_unread_counts(authorized_client, test_user, another_user, another_client, test_message):
+    message_data = {
+        **test_message,
+        "receiver_id": test_user.id
+    }
+    ids = [another_client.post("/messages/", json=message_data).json()["id"] for _ in range(3)]
+
+    response = authorized_client.get("/messages/unread/counts")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"sender_id": another_user["id"], "unread_count": 3}]
+
+    # Both mark-read paths keep the counter in step
+    authorized_client.put(f"/messages/{ids[0]}/read")
+    authorized_client.put(f"/messages/{ids[0]}/read")
+    assert authorized_client.get("/messages/unread/counts").json()[0]["unread_count"] == 2
+
+    authorized_client.put("/messages/read", json={"other_user_id": another_user["id"], "up_to_id": ids[2]})
+    assert authorized_client.get("/messages/unread/counts").json() == []
+
+def test_create_messages_batch(test_user, another_user):
+    from app.routers.messages import create_messages
+    from app.models.user import UnreadCount
+
+    messages = create_messages([
+        (test_user, another_user["id"], "first"),
+        (test_user, 99999, "lost"),
+        (test_user, another_user["id"], "second"),
+    ])
+
+    assert messages[1] is None
+    assert [m.content for m in (messages[0], messages[2])] == ["first", "second"]
+    assert messages[0].id < messages[2].id
+    counter = UnreadCount.get(
+        (UnreadCount.receiver == another_user["id"]) & (UnreadCount.sender == test_user.id)
+    )
+    assert counter.unread == 2
+
+def test_create_messages_matches_ids_to_rows(test_user, another_user):
+    from app.routers.messages import create_messages
+    from app.models.user import Message
+
+    batch = [
+        (test_user, another_user["id"], "same"),
+        (test_user, test_user.id, "note to self"),
+        (test_user, another_user["id"], "same"),
+        (test_user, another_user["id"], "other"),
+    ]
+    messages = create_messages(batch)
+
+    for message, (_, receiver_id, content) in zip(messages, batch):
+        stored = Message.get_by_id(message.id)
+        assert (stored.receiver_id, stored.content) == (receiver_id, content)
+    assert messages[0].id < messages[2].id
+    assert len({message.id for message in messages}) == len(batch)
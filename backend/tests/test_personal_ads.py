@@ -1,6 +1,7 @@
 import pytest
 from fastapi import status
 from datetime import datetime
+from app.schemas.user import PersonalAdResponse
 
 @pytest.fixture
 def test_personal_ad(test_user):
@@ -57,6 +58,52 @@ def test_get_personal_ads(authorized_client, test_user, test_personal_ad):
     assert len(data) > 0
     assert data[0]["content"] == test_personal_ad["content"]
 
+def test_get_personal_ads_matches_schema(authorized_client, test_user, test_personal_ad):
+    # List rows are serialized straight from the database, so check they
+    # still carry exactly the fields of the response schema
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+    authorized_client.post("/personal-ads/", json=test_personal_ad)
+
+    response = authorized_client.get(f"/personal-ads/user/{test_user.id}")
+    assert response.status_code == status.HTTP_200_OK
+    ad = response.json()[0]
+    assert set(ad) == set(PersonalAdResponse.model_fields)
+    assert ad["user_id"] == test_user.id
+    assert ad["distance"] is None
+    PersonalAdResponse.model_validate(ad)
+
+def test_get_personal_ads_sparse_fields(authorized_client, test_user, test_personal_ad):
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+    authorized_client.post("/personal-ads/", json=test_personal_ad)
+
+    fields = "username,content,created_at,distance"
+    for params in ({"fields": fields}, {"fields": fields, "distance": 10}):
+        response = authorized_client.get("/personal-ads/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        ad = response.json()[0]
+        assert set(ad) == set(fields.split(","))
+        assert ad["username"] == test_user.username
+        assert ad["content"] == test_personal_ad["content"]
+        assert ad["distance"] == pytest.approx(0.0)
+
+    response = authorized_client.get("/personal-ads/nearest", params={"fields": "id"})
+    assert response.json() == [{"id": 1}]
+
+    response = authorized_client.get("/personal-ads/", params={"fields": "content,email"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 def test_get_personal_ads_by_distance(authorized_client, test_user, test_personal_ad):
     # Create a personal ad first
     authorized_client.post(
@@ -90,6 +137,27 @@ def test_get_personal_ads_by_distance(authorized_client, test_user, test_persona
     data = response.json()
     assert len(data) == 0
 
+def test_get_personal_ads_by_distance_before_geohash_backfill(
+    authorized_client, test_user, test_personal_ad, monkeypatch
+):
+    from app.models.user import PersonalAd
+    from app.routers.personal_ads import ad_index
+
+    monkeypatch.setattr(ad_index, "ready", False)
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+    ad_id = authorized_client.post("/personal-ads/", json=test_personal_ad).json()["id"]
+    # As left by migration 003 until the backfill reaches the row
+    PersonalAd.update(geohash=None).where(PersonalAd.id == ad_id).execute()
+
+    response = authorized_client.get("/personal-ads/", params={"distance": 10})
+    assert [ad["id"] for ad in response.json()] == [ad_id]
+
 def test_get_specific_personal_ad(authorized_client, test_user, test_personal_ad):
     # Create a personal ad first
     authorized_client.post(
@@ -165,3 +233,134 @@ def test_get_user_personal_ads(authorized_client, test_user, test_personal_ad):
     data = response.json()
     assert len(data) > 0
     assert all(ad["user_id"] == test_user.id for ad in data)
+
+def test_get_personal_ads_sorted_by_distance(authorized_client, test_user, test_personal_ad):
+    # Create two ads at different locations
+    for offset in (0.5, 0.1):
+        authorized_client.post(
+            "/users/me/location",
+            params={
+                "latitude": test_personal_ad["latitude"] + offset,
+                "longitude": test_personal_ad["longitude"]
+            }
+        )
+        authorized_client.post("/personal-ads/", json=test_personal_ad)
+
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+
+    response = authorized_client.get("/personal-ads/", params={"distance": 60})
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert len(data) == 2
+    assert data[0]["distance"] < data[1]["distance"]
+    assert data[0]["distance"] == pytest.approx(6.9, abs=0.1)
+
+@pytest.mark.parametrize("params", [{}, {"distance": 60}])
+def test_get_personal_ads_paginated(authorized_client, test_user, test_personal_ad, params):
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+    created_ids = [
+        authorized_client.post("/personal-ads/", json=test_personal_ad).json()["id"]
+        for _ in range(3)
+    ]
+
+    first_page = authorized_client.get("/personal-ads/", params={**params, "limit": 2})
+    assert first_page.status_code == status.HTTP_200_OK
+    assert len(first_page.json()) == 2
+    cursor = first_page.headers["X-Next-Cursor"]
+
+    second_page = authorized_client.get(
+        "/personal-ads/",
+        params={**params, "limit": 2, "cursor": cursor}
+    )
+    assert second_page.status_code == status.HTTP_200_OK
+    assert len(second_page.json()) == 1
+    assert "X-Next-Cursor" not in second_page.headers
+
+    seen_ids = [ad["id"] for ad in first_page.json() + second_page.json()]
+    assert sorted(seen_ids) == sorted(created_ids)
+
+def test_get_personal_ads_invalid_cursor(authorized_client):
+    response = authorized_client.get("/personal-ads/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Invalid cursor" in response.json()["detail"]
+
+def test_get_personal_ads_not_modified(authorized_client, test_user, test_personal_ad):
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+    ad_id = authorized_client.post("/personal-ads/", json=test_personal_ad).json()["id"]
+
+    for params in ({}, {"distance": 10}):
+        response = authorized_client.get("/personal-ads/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        etag = response.headers["etag"]
+
+        response = authorized_client.get("/personal-ads/", params=params, headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    # Another page or another field set is a different response
+    response = authorized_client.get("/personal-ads/", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+
+    etag = authorized_client.get("/personal-ads/").headers["etag"]
+    authorized_client.delete(f"/personal-ads/{ad_id}")
+    response = authorized_client.get("/personal-ads/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+    assert response.headers["etag"] != etag
+
+def test_get_personal_ads_etag_follows_author_renames(authorized_client, test_user, test_personal_ad):
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": test_personal_ad["latitude"],
+            "longitude": test_personal_ad["longitude"]
+        }
+    )
+    authorized_client.post("/personal-ads/", json=test_personal_ad)
+    params = {"fields": "id,username"}
+    etag = authorized_client.get("/personal-ads/", params=params).headers["etag"]
+
+    authorized_client.put("/users/me", json={"username": "renameduser"})
+    token = authorized_client.post(
+        "/users/token",
+        data={"username": "renameduser", "password": "testpass"}
+    ).json()["access_token"]
+    response = authorized_client.get(
+        "/personal-ads/",
+        params=params,
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["username"] == "renameduser"
+
+def test_etag_matches():
+    from app.core.conditional import etag_matches, make_etag
+
+    etag = make_etag(1, "a")
+    assert etag.startswith('W/"')
+    assert etag == make_etag(1, "a")
+    assert etag != make_etag(2, "a")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag.removeprefix("W/")}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
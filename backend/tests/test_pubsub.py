@@ -0,0 +1,80 @@
+import asyncio
+import json
+import time
+
+from app.core.events import Event
+from app.core.pubsub import EventBridge
+
+class RecordingManager:
+    def __init__(self):
+        self.sent = []
+
+    def send_personal_message(self, message, user_id):
+        self.sent.append((user_id, message))
+
+def test_dispatch_delivers_other_workers_events():
+    manager = RecordingManager()
+    bridge = EventBridge(manager)
+    other_worker = EventBridge(RecordingManager())
+
+    payload = json.loads(other_worker.encode(7, Event("greeting", {"text": "hello"})))
+    payload["sent_at"] = time.time() - 0.05
+    bridge.dispatch(json.dumps(payload))
+
+    [(user_id, event)] = manager.sent
+    assert user_id == 7
+    assert event.payload == {"type": "greeting", "data": {"text": "hello"}}
+    stats = bridge.stats()
+    assert stats["received"] == 1
+    assert stats["max_lag_ms"] >= 50
+
+def test_dispatch_skips_own_events():
+    manager = RecordingManager()
+    bridge = EventBridge(manager)
+
+    bridge.dispatch(bridge.encode(7, Event("greeting", {})))
+
+    assert manager.sent == []
+    assert bridge.stats()["received"] == 0
+
+def test_send_without_listener_delivers_locally():
+    manager = RecordingManager()
+    bridge = EventBridge(manager)
+
+    event = Event("greeting", {})
+    asyncio.run(bridge.send(7, event))
+
+    assert manager.sent == [(7, event)]
+    assert bridge.stats()["published"] == 0
+
+def test_publish_holds_a_connection_only_for_the_notify(monkeypatch):
+    from contextlib import contextmanager
+    from app.core import pubsub
+
+    class FakeDatabase:
+        def __init__(self):
+            self.open = False
+            self.executed = []
+
+        @contextmanager
+        def connection_context(self):
+            self.open = True
+            try:
+                yield
+            finally:
+                self.open = False
+
+        def execute_sql(self, sql, params):
+            assert self.open
+            self.executed.append(params)
+
+    fake = FakeDatabase()
+    monkeypatch.setattr(pubsub, "db", fake)
+    bridge = EventBridge(RecordingManager())
+    bridge.enabled = True
+
+    asyncio.run(bridge.send(7, Event("greeting", {})))
+
+    assert len(fake.executed) == 1
+    assert not fake.open
+    assert bridge.stats()["published"] == 1
@@ -0,0 +1,103 @@
+import pytest
+from fastapi import status
+
+from app.core.spatial_index import SpatialIndex, BYTES_PER_ENTRY
+
+NYC = (40.7128, -74.0060)
+
+@pytest.fixture
+def index():
+    index = SpatialIndex(cell_degrees=0.25, memory_budget_bytes=1024 * 1024)
+    index.rebuild([
+        (1, 40.7128, -74.0060),    # New York
+        (2, 40.8128, -74.0060),    # ~7 miles north
+        (3, 41.4128, -74.0060),    # ~48 miles north
+        (4, 34.0522, -118.2437),   # Los Angeles
+    ])
+    return index
+
+def test_within_returns_nearest_first(index):
+    found = index.within(*NYC, 60)
+    assert [point_id for point_id, _ in found] == [1, 2, 3]
+    assert found[1][1] == pytest.approx(6.9, abs=0.1)
+
+def test_nearest(index):
+    assert [point_id for point_id, _ in index.nearest(*NYC, 2)] == [1, 2]
+    assert [point_id for point_id, _ in index.nearest(*NYC, 4)] == [1, 2, 3, 4]
+    assert len(index.nearest(*NYC, 4, max_radius_miles=100)) == 3
+
+def test_incremental_updates(index):
+    index.remove(2)
+    index.upsert(3, 40.7228, -74.0060)
+    assert [point_id for point_id, _ in index.within(*NYC, 10)] == [1, 3]
+
+def test_memory_budget(index):
+    small = SpatialIndex(cell_degrees=0.25, memory_budget_bytes=2 * BYTES_PER_ENTRY)
+    small.rebuild([(1, 0.0, 0.0), (2, 1.0, 1.0), (3, 2.0, 2.0)])
+    assert not small.ready
+    assert small.stats()["over_budget"]
+
+def test_personal_ads_served_from_index(authorized_client, test_user, monkeypatch):
+    from app.routers.personal_ads import ad_index
+
+    monkeypatch.setattr(ad_index, "ready", False)
+    ad_index.rebuild([])
+
+    authorized_client.post(
+        "/users/me/location",
+        params={"latitude": NYC[0], "longitude": NYC[1]}
+    )
+    ad_id = authorized_client.post(
+        "/personal-ads/",
+        json={"content": "Indexed ad", "latitude": NYC[0], "longitude": NYC[1]}
+    ).json()["id"]
+    assert ad_index.stats()["entries"] == 1
+
+    response = authorized_client.get("/personal-ads/nearest", params={"k": 5})
+    assert response.status_code == status.HTTP_200_OK
+    assert [ad["id"] for ad in response.json()] == [ad_id]
+
+    authorized_client.delete(f"/personal-ads/{ad_id}")
+    assert ad_index.stats()["entries"] == 0
+
+def test_feed_etag_follows_the_index(authorized_client, test_user, monkeypatch):
+    from app.routers.personal_ads import ad_index
+
+    monkeypatch.setattr(ad_index, "ready", False)
+    ad_index.rebuild([])
+
+    authorized_client.post(
+        "/users/me/location",
+        params={"latitude": NYC[0], "longitude": NYC[1]}
+    )
+    ad_id = authorized_client.post(
+        "/personal-ads/",
+        json={"content": "Indexed ad", "latitude": NYC[0], "longitude": NYC[1]}
+    ).json()["id"]
+
+    # The index missed the ad, as if another worker had created it
+    ad_index.remove(ad_id)
+    response = authorized_client.get("/personal-ads/", params={"distance": 10})
+    assert response.json() == []
+    etag = response.headers["etag"]
+
+    # The database is unchanged, but the rebuilt index answers differently
+    ad_index.rebuild([(ad_id, *NYC)])
+    response = authorized_client.get(
+        "/personal-ads/",
+        params={"distance": 10},
+        headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [ad["id"] for ad in response.json()] == [ad_id]
+
+def test_updates_during_a_rebuild_survive_it(index):
+    def snapshot():
+        # Read before the writes below, as a slow rebuild query would be
+        yield (1, 40.7128, -74.0060)
+        index.upsert(5, 40.7228, -74.0060)
+        index.remove(1)
+        yield (2, 40.8128, -74.0060)
+
+    index.rebuild(snapshot())
+    assert [point_id for point_id, _ in index.within(*NYC, 10)] == [5, 2]
@@ -71,6 +71,11 @@ def test_get_current_user(authorized_client, test_user):
     assert data["username"] == test_user.username
     assert data["email"] == test_user.email
 
+def test_get_current_user_sparse_fields(authorized_client, test_user):
+    response = authorized_client.get("/users/me", params={"fields": "username,id"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"id": test_user.id, "username": test_user.username}
+
 def test_get_current_user_unauthorized(client):
     response = client.get("/users/me")
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -127,3 +132,85 @@ def test_update_location(authorized_client):
     user_data = user_response.json()
     assert user_data["latitude"] == 40.7128
     assert user_data["longitude"] == -74.0060
+
+def test_current_user_is_cached(authorized_client, test_user):
+    from app.routers.user import user_cache
+
+    authorized_client.get("/users/me")
+    hits = user_cache.hits
+    response = authorized_client.get("/users/me")
+    assert response.status_code == status.HTTP_200_OK
+    assert user_cache.hits == hits + 1
+
+def test_update_location_invalidates_cached_user(authorized_client):
+    authorized_client.get("/users/me")
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": 51.5074,
+            "longitude": -0.1278
+        }
+    )
+
+    user_data = authorized_client.get("/users/me").json()
+    assert user_data["latitude"] == 51.5074
+    assert user_data["longitude"] == -0.1278
+
+def test_update_from_cached_user_keeps_other_columns(authorized_client, test_user):
+    from app.models.user import User
+
+    # Cache the row, then change it behind the cache's back
+    authorized_client.get("/users/me")
+    User.update(password_hash="changed elsewhere").where(User.id == test_user.id).execute()
+
+    authorized_client.post(
+        "/users/me/location",
+        params={
+            "latitude": 51.5074,
+            "longitude": -0.1278
+        }
+    )
+
+    user = User.get_by_id(test_user.id)
+    assert user.password_hash == "changed elsewhere"
+    assert user.latitude == 51.5074
+    assert user.geohash is not None
+
+def test_login_rejected_when_hash_queue_full(client, test_user, monkeypatch):
+    from app.core.security import password_hasher
+
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    response = client.post(
+        "/users/token",
+        data={
+            "username": "testuser",
+            "password": "testpass"
+        }
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert "Retry-After" in response.headers
+
+def test_login_recovers_from_a_broken_hash_pool(client, test_user, monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+    from app.core.security import password_hasher
+
+    class BrokenPool:
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("A worker died")
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            pass
+
+    credentials = {"username": "testuser", "password": "testpass"}
+    monkeypatch.setattr(password_hasher, "_executor", BrokenPool())
+    response = client.post("/users/token", data=credentials)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert "Retry-After" in response.headers
+
+    # The broken pool was dropped, so the next login gets a fresh one
+    response = client.post("/users/token", data=credentials)
+    assert response.status_code == status.HTTP_200_OK
+
+def test_token_length_is_bounded(client):
+    response = client.get("/users/me", headers={"Authorization": "Bearer " + "a" * 5000})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -32,7 +32,7 @@ version = 0.1
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy==2.2.1,kivymd==1.1.1,pillow,requests,websockets,asyncio,aiohttp,python-dotenv,certifi,urllib3,geopy,plyer,android
+requirements = python3,kivy==2.2.1,kivymd==1.1.1,pillow,requests,websockets,asyncio,aiohttp,python-dotenv,certifi,urllib3,plyer,android
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes
@@ -1,6 +1,7 @@
 import json
 import aiohttp
 import asyncio
+import uuid
 import websockets
 from kivy.clock import Clock
 from kivymd.uix.screen import MDScreen
@@ -33,6 +34,7 @@ class MessagesScreen(MDScreen):
         self.dialog = None
         self.ws = None
         self.chats = {}  # Store chat history
+        self.pending = {}  # Messages sent over the socket awaiting their ack
         Clock.schedule_interval(self.check_websocket, 5)  # Check WebSocket connection every 5 seconds
     
     def on_enter(self):
@@ -53,21 +55,20 @@ class MessagesScreen(MDScreen):
             async with aiohttp.ClientSession() as session:
                 headers = {"Authorization": f"Bearer {self.app.access_token}"}
                 
-                # Get unread messages to identify active chats
+                # One request returns every conversation with the partner's
+                # profile, the latest message and the unread count
                 async with session.get(
-                    f"{self.app.api_url}/messages/unread",
+                    f"{self.app.api_url}/messages/conversations",
                     headers=headers
                 ) as response:
                     if response.status == 200:
-                        unread_messages = await response.json()
-                        # Process unread messages to get unique users
-                        chat_users = set()
-                        for msg in unread_messages:
-                            chat_users.add(msg['sender_id'])
-                        
-                        # Load chat history for each user
-                        for user_id in chat_users:
-                            await self.load_chat_history(user_id)
+                        conversations = await response.json()
+                        for conversation in conversations:
+                            user_id = conversation["user"]["id"]
+                            chat = self.chats.setdefault(user_id, {"messages": []})
+                            chat["user"] = conversation["user"]
+                            chat["last_message"] = conversation["last_message"]
+                            chat["unread_count"] = conversation["unread_count"]
                         
                         Clock.schedule_once(self.update_chat_list)
         except Exception as e:
@@ -78,27 +79,29 @@ class MessagesScreen(MDScreen):
         try:
             async with aiohttp.ClientSession() as session:
                 headers = {"Authorization": f"Bearer {self.app.access_token}"}
+                messages = []
                 
-                # Get user info
                 async with session.get(
-                    f"{self.app.api_url}/users/{other_user_id}",
-                    headers=headers
-                ) as user_response:
-                    if user_response.status == 200:
-                        user_data = await user_response.json()
-                        
-                        # Get messages
-                        async with session.get(
-                            f"{self.app.api_url}/messages/",
-                            headers=headers,
-                            params={"other_user_id": other_user_id}
-                        ) as messages_response:
-                            if messages_response.status == 200:
-                                messages = await messages_response.json()
-                                self.chats[other_user_id] = {
-                                    "user": user_data,
-                                    "messages": messages
-                                }
+                    f"{self.app.api_url}/messages/",
+                    headers=headers,
+                    params={"other_user_id": other_user_id}
+                ) as messages_response:
+                    if messages_response.status == 200:
+                        messages = await messages_response.json()
+                        # In place: an open chat's active_chat is a copy of
+                        # this dict that shares the list, not the dict itself
+                        self.chats[other_user_id]["messages"][:] = messages
+                        Clock.schedule_once(self.update_messages_list)
+                
+                # Mark everything shown as read in one request
+                if messages and self.chats[other_user_id].get("unread_count"):
+                    async with session.put(
+                        f"{self.app.api_url}/messages/read",
+                        headers=headers,
+                        json={"other_user_id": other_user_id, "up_to_id": messages[-1]["id"]}
+                    ) as read_response:
+                        if read_response.status == 200:
+                            self.chats[other_user_id]["unread_count"] = 0
         except Exception as e:
             self.show_error_dialog(f"Error loading chat history: {str(e)}")
     
@@ -106,10 +109,9 @@ class MessagesScreen(MDScreen):
         """Update the chat list UI."""
         self.chat_list.clear_widgets()
         for user_id, chat_data in self.chats.items():
-            last_message = chat_data["messages"][-1] if chat_data["messages"] else None
             item = ChatListItem(
                 chat_data["user"],
-                last_message,
+                chat_data.get("last_message"),
                 on_release=lambda x, uid=user_id: self.open_chat(uid)
             )
             self.chat_list.add_widget(item)
@@ -119,6 +121,9 @@ class MessagesScreen(MDScreen):
         if user_id in self.chats:
             self.active_chat = self.chats[user_id]
             self.update_messages_list()
+            # Only the latest message comes with the chat list; fetch the
+            # full history when the chat is opened
+            asyncio.create_task(self.load_chat_history(user_id))
     
     def update_messages_list(self, *args):
         """Update the messages list UI."""
@@ -163,6 +168,27 @@ class MessagesScreen(MDScreen):
         if not self.active_chat or not self.chat_input.text:
             return
         
+        if self.ws:
+            # Send over the open socket; the server acks with the stored id
+            client_id = uuid.uuid4().hex
+            self.pending[client_id] = {
+                "content": self.chat_input.text,
+                "sender_id": self.app.current_user["id"],
+                "receiver_id": self.active_chat["user"]["id"],
+            }
+            try:
+                await self.ws.send(json.dumps({
+                    "type": "send_message",
+                    "client_id": client_id,
+                    **self.pending[client_id]
+                }))
+                self.chat_input.text = ""
+                return
+            except websockets.exceptions.ConnectionClosed:
+                # Fall back to HTTP below
+                self.pending.pop(client_id, None)
+                self.ws = None
+        
         try:
             async with aiohttp.ClientSession() as session:
                 headers = {"Authorization": f"Bearer {self.app.access_token}"}
@@ -178,7 +204,9 @@ class MessagesScreen(MDScreen):
                 ) as response:
                     if response.status == 200:
                         message = await response.json()
-                        self.active_chat["messages"].append(message)
+                        chat = self.chats[message["receiver_id"]]
+                        chat["messages"].append(message)
+                        chat["last_message"] = message
                         Clock.schedule_once(lambda x: self.add_message_to_list(message, True))
                         self.chat_input.text = ""
                     else:
@@ -204,21 +232,53 @@ class MessagesScreen(MDScreen):
         """Listen for WebSocket messages."""
         try:
             while True:
-                message = await self.ws.recv()
-                data = json.loads(message)
-                if data["type"] == "new_message":
-                    sender_id = data["sender_id"]
-                    if sender_id not in self.chats:
-                        await self.load_chat_history(sender_id)
-                    elif self.active_chat and sender_id == self.active_chat["user"]["id"]:
-                        self.active_chat["messages"].append(data)
-                        Clock.schedule_once(lambda x: self.add_message_to_list(data, False))
-        except websockets.exceptions.ConnectionClosed:
+                frame = json.loads(await self.ws.recv())
+                # Events queued together on the server arrive as one array
+                for event in frame if isinstance(frame, list) else [frame]:
+                    await self.handle_event(event["type"], event["data"])
+        except websockets.exceptions.ConnectionClosed as e:
             self.ws = None
+            if e.rcvd and e.rcvd.code == 1008:
+                # The server no longer accepts our token; reconnecting with
+                # it would only be turned away again
+                self.app.logout()
+                self.show_error_dialog("Your session has expired, please log in again")
         except Exception as e:
             self.show_error_dialog(f"WebSocket error: {str(e)}")
             self.ws = None
     
+    async def handle_event(self, event_type, data):
+        """Apply a real-time event received over the WebSocket."""
+        if event_type == "ping":
+            # Keeps the server from evicting this socket as half-open
+            await self.ws.send(json.dumps({"type": "pong"}))
+        elif event_type == "new_message":
+            sender_id = data["sender_id"]
+            if sender_id not in self.chats:
+                await self.load_chats()
+            elif self.active_chat and sender_id == self.active_chat["user"]["id"]:
+                self.active_chat["messages"].append(data)
+                Clock.schedule_once(lambda x, m=data: self.add_message_to_list(m, False))
+        elif event_type == "ack":
+            message = self.pending.pop(data["client_id"], None)
+            if message:
+                message.update(id=data["id"], created_at=data["created_at"], is_read=False)
+                chat = self.chats.get(message["receiver_id"])
+                if chat:
+                    chat["messages"].append(message)
+                    chat["last_message"] = message
+                    if self.active_chat and self.active_chat["user"]["id"] == message["receiver_id"]:
+                        Clock.schedule_once(lambda x, m=message: self.add_message_to_list(m, True))
+        elif event_type == "error":
+            self.pending.pop(data.get("client_id"), None)
+            self.show_error_dialog(data.get("detail", "Failed to send message"))
+        elif event_type == "messages_read":
+            chat = self.chats.get(data["reader_id"])
+            if chat:
+                for msg in chat["messages"]:
+                    if msg["sender_id"] != data["reader_id"] and msg["id"] <= data["up_to_id"]:
+                        msg["is_read"] = True
+    
     def disconnect_websocket(self):
         """Disconnect WebSocket."""
         if self.ws:
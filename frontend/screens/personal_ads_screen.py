@@ -10,7 +10,9 @@ from kivymd.uix.list import MDList
 from kivy.metrics import dp
 from datetime import datetime
 from functools import partial
-from geopy.distance import geodesic
+
+# The only ad fields the cards render
+AD_FIELDS = "username,content,created_at,distance"
 
 class PersonalAdCard(MDCard):
     def __init__(self, ad_data, **kwargs):
@@ -72,6 +74,10 @@ class PersonalAdsScreen(MDScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.dialog = None
+        # Tag of the feed on screen and the query it answers, sent back so
+        # polls return 304 without a body while nothing has changed
+        self.feed_etag = None
+        self.feed_params = None
         Clock.schedule_interval(self.refresh_ads, 60)  # Refresh every minute
     
     def on_enter(self):
@@ -86,15 +92,24 @@ class PersonalAdsScreen(MDScreen):
         try:
             async with aiohttp.ClientSession() as session:
                 headers = {"Authorization": f"Bearer {self.app.access_token}"}
-                params = {"distance": self.distance_filter} if self.distance_filter else {}
+                params = {"fields": AD_FIELDS}
+                if self.distance_filter:
+                    params["distance"] = self.distance_filter
+                if self.feed_etag and params == self.feed_params:
+                    headers["If-None-Match"] = self.feed_etag
                 
                 async with session.get(
                     f"{self.app.api_url}/personal-ads/",
                     headers=headers,
                     params=params
                 ) as response:
+                    if response.status == 304:
+                        # The ads on screen are still current
+                        return
                     if response.status == 200:
                         ads = await response.json()
+                        self.feed_etag = response.headers.get("ETag")
+                        self.feed_params = params
                         Clock.schedule_once(partial(self.display_ads, ads))
                     else:
                         self.show_error_dialog("Failed to fetch personal ads")
@@ -105,13 +120,9 @@ class PersonalAdsScreen(MDScreen):
         """Display the fetched ads."""
         self.ads_list.clear_widgets()
         for ad in ads:
-            # Calculate distance if coordinates are available
-            if (self.app.current_user.get('latitude') and 
-                self.app.current_user.get('longitude') and
-                ad.get('latitude') and ad.get('longitude')):
-                user_coords = (self.app.current_user['latitude'], self.app.current_user['longitude'])
-                ad_coords = (ad['latitude'], ad['longitude'])
-                ad['distance'] = geodesic(user_coords, ad_coords).miles
+            # The API already measured each ad's distance from the user
+            if ad.get('distance') is None:
+                ad.pop('distance', None)
             
             card = PersonalAdCard(ad)
             self.ads_list.add_widget(card)
@@ -1,5 +1,7 @@
+import json
+import mimetypes
 import os
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, render_template, request, send_from_directory
 from flask_socketio import SocketIO, emit
 from kivy.config import Config
 
@@ -93,24 +95,68 @@ class EnbySocialWebApp(MDApp):
         self.root.current = 'login'
 
 # Create Flask app
-app = Flask(__name__)
+# static/ is served by send_static below, which knows the hashed names
+app = Flask(__name__, static_folder=None)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Create Kivy app instance
 kivy_app = None
 
+# Content-hashed, precompressed copies of static/ and assets/ written by
+# build_assets.py. Their names change with their content, so browsers may
+# cache them for a year; files served under their original names must be
+# revalidated instead.
+DIST_DIR = 'dist'
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+def load_asset_manifest():
+    try:
+        with open(os.path.join(DIST_DIR, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+asset_manifest = load_asset_manifest()
+hashed_assets = set(asset_manifest.values())
+
+@app.template_global()
+def asset_url(path):
+    """URL of a static file, e.g. asset_url('static/app.css')."""
+    return '/' + asset_manifest.get(path, path)
+
+def send_asset(directory, path):
+    hashed = f"{directory}/{path}"
+    if hashed not in hashed_assets:
+        response = send_from_directory(directory, path)
+        response.headers['Cache-Control'] = REVALIDATE_CACHE
+        return response
+
+    # Serve the best precompressed copy the client accepts
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] > 0 and os.path.isfile(os.path.join(DIST_DIR, hashed + suffix)):
+            response = send_from_directory(DIST_DIR, hashed + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, hashed, mimetype=mimetype)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/static/<path:path>')
 def send_static(path):
-    return send_from_directory('static', path)
+    return send_asset('static', path)
 
 @app.route('/assets/<path:path>')
 def send_assets(path):
-    return send_from_directory('assets', path)
+    return send_asset('assets', path)
 
 @socketio.on('connect')
 def handle_connect():
@@ -0,0 +1,68 @@
+"""Build step for the static files served by app.py.
+
+Every file under ``static/`` and ``assets/`` is copied to ``dist/`` under a
+content-hashed name, e.g. ``static/app.css`` becomes
+``dist/static/app.3f2a9c1b7e04.css``. Text files also get ``.gz`` and, when
+the ``brotli`` package is installed, ``.br`` siblings compressed at the
+highest level, so the server never compresses them per request. A changed
+file gets a new name, which lets browsers cache them for good.
+
+``dist/manifest.json`` maps each original path to its hashed path.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:  # Only gzip copies are written without it
+    brotli = None
+
+SOURCE_DIRS = ('static', 'assets')
+DIST_DIR = 'dist'
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+# Already compressed formats gain nothing from another pass
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.kv', '.ttf', '.otf', '.map'
+}
+
+def hashed_name(path, content):
+    stem, ext = os.path.splitext(path)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"{stem}.{digest}{ext}"
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        for root, _, files in os.walk(source_dir):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    content = f.read()
+
+                logical = os.path.relpath(path).replace(os.sep, '/')
+                hashed = hashed_name(logical, content)
+                target = os.path.join(DIST_DIR, hashed)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(content)
+
+                if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                    with open(target + '.gz', 'wb') as f:
+                        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        with open(target + '.br', 'wb') as f:
+                            f.write(brotli.compress(content, quality=11))
+                manifest[logical] = hashed
+
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"Built {len(manifest)} static files into {DIST_DIR}/")
+
+if __name__ == '__main__':
+    build()
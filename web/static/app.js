@@ -0,0 +1,79 @@
+// Initialize Socket.IO
+const socket = io();
+
+// Initialize Kivy app
+window.onload = function() {
+    const canvas = document.getElementById('kivy-canvas');
+    const loading = document.getElementById('loading');
+
+    // Initialize Kivy
+    window.kivy = {
+        canvas: canvas,
+        socket: socket,
+
+        // Called when Kivy app is ready
+        onReady: function() {
+            loading.style.display = 'none';
+            canvas.style.display = 'block';
+        },
+
+        // Called when user logs in
+        onLogin: function(token) {
+            socket.emit('user_login', { token: token });
+        },
+
+        // Called when user logs out
+        onLogout: function() {
+            socket.emit('user_logout');
+        },
+
+        // Send message through Socket.IO
+        sendMessage: function(message) {
+            socket.emit('message', message);
+        }
+    };
+
+    // Socket.IO event handlers
+    socket.on('connect', () => {
+        console.log('Socket.IO connected');
+    });
+
+    socket.on('disconnect', () => {
+        console.log('Socket.IO disconnected');
+    });
+
+    socket.on('message', (data) => {
+        // Forward message to Kivy app
+        if (window.kivy.onMessage) {
+            window.kivy.onMessage(data);
+        }
+    });
+
+    // Handle window resize
+    window.addEventListener('resize', function() {
+        const app = document.getElementById('kivy-app');
+        const width = app.clientWidth;
+        const height = app.clientHeight;
+        canvas.width = width;
+        canvas.height = height;
+        // Notify Kivy app of resize
+        if (window.kivy.onResize) {
+            window.kivy.onResize(width, height);
+        }
+    });
+
+    // Handle visibility change
+    document.addEventListener('visibilitychange', function() {
+        if (document.hidden) {
+            // Page is hidden
+            if (window.kivy.onPause) {
+                window.kivy.onPause();
+            }
+        } else {
+            // Page is visible
+            if (window.kivy.onResume) {
+                window.kivy.onResume();
+            }
+        }
+    });
+};